@@ -29,6 +29,7 @@ from .const import (
 )
 from .device import async_delete_device, get_device_id, setup_device
 from .discovery import async_start_discovery, async_stop_discovery
+from .helpers.config import async_load_config_catalog
 from .helpers.device_config import get_config
 from .services import async_setup_services
 
@@ -156,6 +157,7 @@ async def async_migrate_entry(hass, entry: ConfigEntry):
         # Migrate to filename based config_type, to avoid needing to
         # parse config files to find the right one.
         config = {**entry.data, **entry.options, "name": entry.title}
+        await async_load_config_catalog(hass)
         config_yaml = await hass.async_add_executor_job(
             get_config,
             config[CONF_TYPE],
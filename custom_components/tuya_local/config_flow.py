@@ -479,11 +479,7 @@ class ConfigFlowHandler(ConfigFlow, domain=DOMAIN):
         best_matching_type = None
         best_matching_key = None
 
-        for dev_type in await self.device.async_possible_types():
-            q = dev_type.match_quality(
-                self.device._get_cached_state(),
-                self.device._product_ids,
-            )
+        for dev_type, q in await self.device.async_ranked_types():
             for manufacturer, model in dev_type.product_display_entries(
                 self.device._product_ids
             ):
@@ -1,6 +1,10 @@
 DOMAIN = "tuya_local"
 DATA_STORE = "store"
 DATA_DISCOVERY = "discovery"
+DATA_CATALOG_LOCK = "catalog_lock"
+DATA_IO_POOL = "io_pool"
+# Threads used for communicating with devices
+DEFAULT_IO_WORKERS = 16
 
 CONF_DEVICE_ID = "device_id"
 CONF_LOCAL_KEY = "local_key"
@@ -5,6 +5,7 @@ API for Tuya Local devices.
 import asyncio
 import logging
 from asyncio.exceptions import CancelledError
+from collections import Counter
 from threading import Lock
 from time import time
 
@@ -28,9 +29,12 @@ from .const import (
     CONF_PROTOCOL_VERSION,
     DOMAIN,
 )
-from .helpers.config import get_device_id
-from .helpers.device_config import possible_matches
+from .helpers.config import async_load_config_catalog, get_device_id
+from .helpers.device_config import rank_matches
+from .helpers.gateway import GatewayReader
+from .helpers.io_pool import async_wait_readable, device_io_pool
 from .helpers.log import log_json
+from .helpers.scheduler import FULL_POLL, HEARTBEAT, poll_scheduler
 
 _LOGGER = logging.getLogger(__name__)
 
@@ -43,11 +47,6 @@ _ERROR_HINTS = {
 }
 
 
-def _collect_possible_matches(cached_state, product_ids):
-    """Collect possible matches from generator into an array."""
-    return list(possible_matches(cached_state, product_ids))
-
-
 class TuyaLocalDevice(object):
     def __init__(
         self,
@@ -81,7 +80,22 @@ class TuyaLocalDevice(object):
         self._manufacturer = manufacturer
         self._model = model
         self._children = []
-        self._force_dps = []
+        # dp id -> child entities whose state depends on that dp
+        self._dependents = {}
+        # ids of dps used by event entities, counted once per entity using
+        # them, which are updated even when unchanged
+        self._repeat_dps = Counter()
+        # dps of each child entity, as registered
+        self._entity_dps = {}
+        # ids of non-persistent dps, counted once per entity using them
+        self._non_persistent_dps = Counter()
+        # ids of dps to request with updatedps, as integers
+        self._force_dps = Counter()
+        self._sensitive_dps = Counter()
+        # names of sensitive dps by entity config_id
+        self._sensitive_names = {}
+        self._received_changed = 0
+        self._received_unchanged = 0
         self._product_ids = []
         self._running = False
         self._shutdown_listener = None
@@ -112,6 +126,15 @@ class TuyaLocalDevice(object):
                     parent=parent,
                 )
                 self._api_lock = parent_lock
+                entry = hass.data[DOMAIN].get(dev_id)
+                if name != "Test" and "gateway" not in entry:
+                    # sub-devices share a single reader of the gateway
+                    entry["gateway"] = GatewayReader(hass, parent, parent_lock)
+                    # and the gateway itself must stop reading directly.
+                    # Devices are set up in the executor.
+                    gateway_device = entry.get("device")
+                    if gateway_device:
+                        hass.loop.call_soon_threadsafe(gateway_device._wake_receive)
             else:
                 if hass.data[DOMAIN].get(dev_id) and name != "Test":
                     self._api = hass.data[DOMAIN][dev_id]["tuyadevice"]
@@ -145,6 +168,11 @@ class TuyaLocalDevice(object):
         self._protocol_configured = protocol_version
         self._poll_only = poll_only
         self._temporary_poll = False
+        # Incremented whenever the state seen through get_property changes,
+        # so values decoded from the state can be reused until then.
+        self._state_generation = 0
+        # heartbeats and full polls are scheduled together with other devices
+        self._scheduler = poll_scheduler()
         self._reset_cached_state()
 
         self._hass = hass
@@ -157,8 +185,6 @@ class TuyaLocalDevice(object):
         # we can overlay onto the state while we wait for the board to update
         # its switches.
         self._FAKE_IT_TIMEOUT = 5
-        self._CACHE_TIMEOUT = 30
-        self._HEARTBEAT_INTERVAL = 5
         # More attempts are needed in auto mode so we can cycle through all
         # the possibilities a couple of times
         self._AUTO_CONNECTION_ATTEMPTS = len(API_PROTOCOL_VERSIONS) * 2 + 1
@@ -166,6 +192,8 @@ class TuyaLocalDevice(object):
         # The number of failures from a working protocol before retrying other protocols.
         self._AUTO_FAILURE_RESET_COUNT = 10
         self._lock = Lock()
+        self._receive_waiter = None
+        self._gateway = None
 
     @property
     def name(self):
@@ -192,11 +220,27 @@ class TuyaLocalDevice(object):
             info["model"] = self._model
         return info
 
+    @property
+    def state_generation(self):
+        """Return a number that changes whenever the device state changes."""
+        if self._pending_updates:
+            # expiry of pending updates changes the state
+            self._expire_pending_updates()
+        return self._state_generation
+
+    def _state_changed(self):
+        self._state_generation += 1
+
     @property
     def has_returned_state(self):
         """Return True if the device has returned some state."""
-        cached = self._get_cached_state()
-        return len(cached) > 1 or cached.get("updated_at", 0) > 0
+        if self._pending_updates:
+            self._expire_pending_updates()
+        return (
+            len(self._cached_state) > 1
+            or len(self._pending_updates) > 0
+            or self._cached_state.get("updated_at", 0) > 0
+        )
 
     @callback
     def actually_start(self, event=None):
@@ -225,8 +269,17 @@ class TuyaLocalDevice(object):
         _LOGGER.debug("Stopping monitor loop for %s", self.name)
         self._running = False
         self._children.clear()
-        self._force_dps.clear()
+        self._dependents = {}
+        self._repeat_dps = Counter()
+        self._entity_dps = {}
+        self._non_persistent_dps = Counter()
+        self._force_dps = Counter()
+        self._sensitive_dps = Counter()
+        self._sensitive_names = {}
         if self._refresh_task:
+            # let a wait for data finish before closing the connection
+            self._wake_receive()
+            await asyncio.sleep(0)
             self._api.set_socketPersistent(False)
             if self._api.parent:
                 self._api.parent.set_socketPersistent(False)
@@ -241,9 +294,18 @@ class TuyaLocalDevice(object):
         should_poll = len(self._children) == 0 and not self._hass.is_running
 
         self._children.append(entity)
-        for dp in entity._config.dps():
-            if dp.force and dp.id not in self._force_dps:
-                self._force_dps.append(int(dp.id))
+        for dp_id in entity._config.dependencies():
+            self._dependents.setdefault(dp_id, []).append(entity)
+        dps = list(entity._config.dps())
+        self._entity_dps[entity] = dps
+        if entity._config.entity == "event":
+            self._repeat_dps.update(dp.id for dp in dps)
+        self._non_persistent_dps.update(dp.id for dp in dps if not dp.persist)
+        self._force_dps.update(int(dp.id) for dp in dps if dp.force)
+        self._sensitive_dps.update(dp.id for dp in dps if dp.sensitive)
+        sensitive = {dp.name for dp in dps if dp.sensitive}
+        if sensitive:
+            self._sensitive_names[entity._config.config_id] = sensitive
 
         if not self._running and not self._startup_listener:
             self.start()
@@ -254,6 +316,21 @@ class TuyaLocalDevice(object):
 
     async def async_unregister_entity(self, entity):
         self._children.remove(entity)
+        for dependents in self._dependents.values():
+            if entity in dependents:
+                dependents.remove(entity)
+        dps = self._entity_dps.pop(entity, ())
+        if any(dp.sensitive for dp in dps):
+            self._sensitive_names.pop(entity._config.config_id, None)
+        if dps and entity._config.entity == "event":
+            self._repeat_dps.subtract(dp.id for dp in dps)
+            self._repeat_dps = +self._repeat_dps
+        self._non_persistent_dps.subtract(dp.id for dp in dps if not dp.persist)
+        self._non_persistent_dps = +self._non_persistent_dps
+        self._force_dps.subtract(int(dp.id) for dp in dps if dp.force)
+        self._force_dps = +self._force_dps
+        self._sensitive_dps.subtract(dp.id for dp in dps if dp.sensitive)
+        self._sensitive_dps = +self._sensitive_dps
         if not self._children:
             try:
                 await self.async_stop()
@@ -271,9 +348,19 @@ class TuyaLocalDevice(object):
                         log_json(poll),
                     )
                     full_poll = poll.pop("full_poll", False)
+                    had_state = self.has_returned_state
+                    pending = set(self._pending_updates)
+                    changed = self._changed_dps(poll)
                     self._cached_state = self._cached_state | poll
                     self._cached_state["updated_at"] = time()
                     self._remove_properties_from_pending_updates(poll)
+                    self._expire_pending_updates()
+                    # clear non-persistant dps that were not in a full poll
+                    if full_poll:
+                        cleared = self._clear_non_persistent_dps(poll)
+                        changed.update(cleared)
+                    if changed:
+                        self._state_changed()
 
                     for entity in self._children:
                         # let entities trigger off poll contents directly
@@ -288,11 +375,17 @@ class TuyaLocalDevice(object):
                                 entity.entity_id,
                                 e,
                             )
-                        # clear non-persistant dps that were not in a full poll
-                        if full_poll:
-                            for dp in entity._config.dps():
-                                if not dp.persist and dp.id not in poll:
-                                    self._cached_state.pop(dp.id, None)
+                    # events need to see repeated values
+                    changed.update(self._repeat_dps.keys() & poll.keys())
+                    # entities showing a pending value need updating once it
+                    # is confirmed or expires, even when expired elsewhere
+                    settled = pending - self._pending_updates.keys()
+                    settled |= self._expired_updates
+                    self._expired_updates = set()
+                    for entity in self._affected_entities(
+                        changed | settled,
+                        not had_state,
+                    ):
                         entity.schedule_update_ha_state()
                 else:
                     _LOGGER.debug(
@@ -309,11 +402,69 @@ class TuyaLocalDevice(object):
         finally:
             # Ensure the persistent connection is closed when the loop exits
             # and device appears as unavailable
+            self._scheduler.remove(self)
+            self._leave_gateway()
             self._api.set_socketPersistent(False)
             if self._api.parent:
                 self._api.parent.set_socketPersistent(False)
             self._reset_cached_state()
 
+    @property
+    def force_dps(self):
+        """Return the ids of dps that need to be explicitly requested."""
+        return sorted(self._force_dps)
+
+    @property
+    def sensitive_dps(self):
+        """Return the ids of dps holding sensitive data."""
+        return self._sensitive_dps.keys()
+
+    def sensitive_attributes(self, config_id):
+        """Return the names of sensitive dps of the entity with config_id."""
+        return self._sensitive_names.get(config_id, set())
+
+    def _clear_non_persistent_dps(self, poll):
+        """Remove non-persistent dps missing from poll from the cached state,
+        returning the ids of those that were cleared."""
+        cleared = set()
+        for dp_id in self._non_persistent_dps.keys() - poll.keys():
+            if self._cached_state.pop(dp_id, None) is not None:
+                cleared.add(dp_id)
+        return cleared
+
+    def _changed_dps(self, poll):
+        """Return the ids of dps in poll that differ from the cached state."""
+        cached = self._cached_state
+        changed = {
+            dp_id
+            for dp_id, value in poll.items()
+            if dp_id not in cached or cached[dp_id] != value
+        }
+        self._received_changed += len(changed)
+        self._received_unchanged += len(poll) - len(changed)
+        return changed
+
+    @property
+    def received_dps_stats(self):
+        """Return how many received dps changed or repeated the cached state."""
+        changed = self._received_changed
+        unchanged = self._received_unchanged
+        return {
+            "changed": changed,
+            "unchanged": unchanged,
+            "unchanged_ratio": round(unchanged / changed, 2) if changed else None,
+        }
+
+    def _affected_entities(self, dp_ids, all_entities=False):
+        """Return the child entities whose state may change with dp_ids."""
+        if all_entities:
+            return list(self._children)
+        affected = {}
+        for dp_id in dp_ids:
+            for entity in self._dependents.get(dp_id, ()):
+                affected[id(entity)] = entity
+        return list(affected.values())
+
     @property
     def should_poll(self):
         return self._poll_only or self._temporary_poll or not self.has_returned_state
@@ -341,12 +492,17 @@ class TuyaLocalDevice(object):
         if self._api.parent:
             self._api.parent.set_socketPersistent(persist)
 
-        last_heartbeat = self._cached_state.get("updated_at", 0)
+        self._scheduler.add(self)
         while self._running:
+            # sub-devices added later may start sharing the connection
+            self._join_gateway()
             error_count = self._api_working_protocol_failures
             force_backoff = False
+            waited = False
+            have_lock = False
             try:
                 await self._api_lock.acquire()
+                have_lock = True
                 last_cache = self._cached_state.get("updated_at", 0)
                 now = time()
                 full_poll = False
@@ -362,10 +518,11 @@ class TuyaLocalDevice(object):
                     self._api.set_socketPersistent(persist)
                     if self._api.parent:
                         self._api.parent.set_socketPersistent(persist)
-                    self._last_full_poll = 0  # ensure we start with a full poll
+                    # ensure we start with a full poll
+                    self._scheduler.expedite(self, FULL_POLL)
 
-                needs_full_poll = now - self._last_full_poll > self._CACHE_TIMEOUT
-                if now - last_cache > self._CACHE_TIMEOUT or (
+                needs_full_poll = self._scheduler.is_due(self, FULL_POLL, now)
+                if now - last_cache > self._scheduler.interval(FULL_POLL) or (
                     persist and needs_full_poll
                 ):
                     if (
@@ -374,7 +531,7 @@ class TuyaLocalDevice(object):
                         and self._api_protocol_working
                     ):
                         poll = await self._retry_on_failed_connection(
-                            lambda: self._api.updatedps(self._force_dps),
+                            lambda: self._api.updatedps(list(self._force_dps)),
                             f"Failed to update device dps for {self.name}",
                         )
                         dps_updated = True
@@ -385,18 +542,49 @@ class TuyaLocalDevice(object):
                         )
                         dps_updated = False
                         full_poll = True
-                    self._last_full_poll = now
-                    last_heartbeat = now  # reset heartbeat timer on full poll
+                    self._scheduler.done(self, FULL_POLL, now)
+                    # reset heartbeat timer on full poll
+                    self._scheduler.done(self, HEARTBEAT, now)
                 elif persist:
-                    if now - last_heartbeat > self._HEARTBEAT_INTERVAL:
-                        await self._hass.async_add_executor_job(
+                    if self._scheduler.is_due(self, HEARTBEAT, now):
+                        await self._async_io(
                             self._api.heartbeat,
                             True,
                         )
-                        last_heartbeat = now
-                    poll = await self._hass.async_add_executor_job(
-                        self._api.receive,
-                    )
+                        self._scheduler.done(self, HEARTBEAT, now)
+                    # Wait in the event loop for data to arrive, so that
+                    # receive does not hold an executor thread while idle.
+                    next_poll = self._scheduler.next_deadline(self)
+                    if self._gateway:
+                        # Wait for the gateway reader to deliver a message,
+                        # without holding the lock it needs to read.
+                        waited = self._gateway.subscribed(self.dev_cid)
+                        self._api_lock.release()
+                        have_lock = False
+                        try:
+                            poll = await self._async_gateway_receive(next_poll - time())
+                        finally:
+                            await self._api_lock.acquire()
+                            have_lock = True
+                    elif self._api.parent:
+                        # Only one reader can wait on the shared connection,
+                        # so without the gateway reader, take turns with
+                        # the other sub-devices in blocking receives.
+                        poll = await self._async_io(
+                            self._api.receive,
+                        )
+                    else:
+                        ready = await self._async_wait_readable(next_poll - time())
+                        # without a connection to wait on, receive connects
+                        # itself, failing straight away if the device is
+                        # offline, so keep the delay before trying again
+                        waited = ready is not None
+                        if ready is False:
+                            poll = None
+                        else:
+                            poll = await self._async_io(
+                                self._api.receive,
+                            )
                     # Ignore Payload error 904, as 3.4 protocol devices seem to return
                     # this when there is no new data, instead of just returning nothing.
                     if poll and "Err" in poll and poll["Err"] == "904":
@@ -453,21 +641,87 @@ class TuyaLocalDevice(object):
                     self._api.parent.set_socketPersistent(False)
                 force_backoff = True
             finally:
-                if self._api_lock.locked():
+                if have_lock:
                     self._api_lock.release()
             if not self.has_returned_state:
                 force_backoff = True
-            await asyncio.sleep(5 if force_backoff else 0.1)
+            if force_backoff:
+                await asyncio.sleep(5)
+            elif not waited:
+                await asyncio.sleep(0.1)
 
+        self._scheduler.remove(self)
+        self._leave_gateway()
         # Close the persistent connection when exiting the loop
         self._api.set_socketPersistent(False)
         if self._api.parent:
             self._api.parent.set_socketPersistent(False)
 
+    def _find_gateway(self):
+        """Return the reader of the gateway connection shared with other
+        sub-devices, if there is one."""
+        entry = self._hass.data.get(DOMAIN, {}).get(self.dev_id)
+        gateway = entry.get("gateway") if isinstance(entry, dict) else None
+        if gateway and gateway.api is (self._api.parent or self._api):
+            return gateway
+        return None
+
+    def _join_gateway(self):
+        """Receive through the shared gateway reader once there is one."""
+        gateway = self._find_gateway()
+        if gateway is not self._gateway:
+            self._leave_gateway()
+            self._gateway = gateway
+        if gateway:
+            gateway.subscribe(self.dev_cid)
+
+    def _leave_gateway(self):
+        if self._gateway:
+            self._gateway.unsubscribe(self.dev_cid)
+            self._gateway = None
+
+    async def _async_io(self, func, *args):
+        """Run a blocking call to the device in the device I/O pool."""
+        return await device_io_pool(self._hass).async_run(func, *args)
+
+    async def _async_wait_readable(self, timeout):
+        """async_wait_readable for the device connection, woken by sending."""
+        self._receive_waiter = asyncio.get_running_loop().create_future()
+        try:
+            return await async_wait_readable(
+                self._api,
+                timeout,
+                self._receive_waiter,
+            )
+        finally:
+            self._receive_waiter = None
+
+    async def _async_gateway_receive(self, timeout):
+        """Wait for the gateway reader to deliver a message for the device.
+
+        Returns None if nothing arrived before timeout.
+        """
+        self._receive_waiter = asyncio.get_running_loop().create_future()
+        try:
+            return await self._gateway.async_receive(
+                self.dev_cid,
+                timeout,
+                self._receive_waiter,
+            )
+        finally:
+            self._receive_waiter = None
+
+    def _wake_receive(self):
+        """Interrupt a wait for data, so the connection is checked again."""
+        if self._receive_waiter and not self._receive_waiter.done():
+            self._receive_waiter.set_result(False)
+
     def set_detected_product_id(self, product_id):
         self._product_ids.append(product_id)
 
-    async def async_possible_types(self):
+    async def async_ranked_types(self, limit=None):
+        """Return (config, quality) for the configs matching the device,
+        best first, limited to the top limit matches if given."""
         cached_state = self._get_cached_state()
         if len(cached_state) <= 1:
             # in case of device22 devices, we need to poll them with a dp
@@ -491,36 +745,29 @@ class TuyaLocalDevice(object):
             await self.async_refresh()
             cached_state = self._get_cached_state()
 
+        await async_load_config_catalog(self._hass)
         return await self._hass.async_add_executor_job(
-            _collect_possible_matches,
+            rank_matches,
             cached_state,
             self._product_ids,
+            limit,
         )
 
     async def async_inferred_type(self):
-        best_match = None
-        best_quality = 0
-        cached_state = self._get_cached_state()
-        possible = await self.async_possible_types()
-        for config in possible:
-            quality = config.match_quality(cached_state, self._product_ids)
+        for config, quality in await self.async_ranked_types(1):
             _LOGGER.info(
-                "%s considering %s with quality %s",
+                "%s best match is %s with quality %s",
                 self.name,
                 config.name,
                 quality,
             )
-            if quality > best_quality:
-                best_quality = quality
-                best_match = config
-
-        if best_match:
-            return best_match.config_type
+            if quality > 0:
+                return config.config_type
 
         _LOGGER.warning(
             "Detection for %s with dps %s failed",
             self.name,
-            log_json(cached_state),
+            log_json(self._get_cached_state()),
         )
 
     async def async_refresh(self):
@@ -532,8 +779,13 @@ class TuyaLocalDevice(object):
             )
 
     def get_property(self, dps_id):
-        cached_state = self._get_cached_state()
-        return cached_state.get(dps_id)
+        # pending updates are overlaid on the cached state without copying
+        if self._pending_updates:
+            self._expire_pending_updates()
+            update = self._pending_updates.get(dps_id)
+            if update is not None:
+                return update["value"]
+        return self._cached_state.get(dps_id)
 
     async def async_set_property(self, dps_id, value):
         await self.async_set_properties({dps_id: value})
@@ -548,12 +800,21 @@ class TuyaLocalDevice(object):
         The anticipated value will be cleared with the next update.
         """
         self._cached_state[dps_id] = value
+        self._state_changed()
+
+    def clear_property(self, dps_id):
+        """Remove a value from the cached state, until the next update."""
+        if self._cached_state.pop(dps_id, None) is not None:
+            self._state_changed()
 
     def _reset_cached_state(self):
         self._cached_state = {"updated_at": 0}
         self._pending_updates = {}
+        # sent updates dropped without confirmation since the last receive
+        self._expired_updates = set()
+        self._state_changed()
         self._last_connection = 0
-        self._last_full_poll = 0
+        self._scheduler.expedite(self, FULL_POLL)
 
     def _refresh_cached_state(self):
         new_state = self._api.status()
@@ -561,11 +822,10 @@ class TuyaLocalDevice(object):
             if "Err" not in new_state:
                 self._cached_state = self._cached_state | new_state.get("dps", {})
                 self._cached_state["updated_at"] = time()
+                # Clear non-persistant dps that were not in the poll
+                self._clear_non_persistent_dps(new_state.get("dps", {}))
+                self._state_changed()
                 for entity in self._children:
-                    for dp in entity._config.dps():
-                        # Clear non-persistant dps that were not in the poll
-                        if not dp.persist and dp.id not in new_state.get("dps", {}):
-                            self._cached_state.pop(dp.id, None)
                     entity.schedule_update_ha_state()
             elif self._api_working_protocol_failures == 1:
                 _LOGGER.warning(
@@ -609,6 +869,7 @@ class TuyaLocalDevice(object):
                 "updated_at": now,
                 "sent": False,
             }
+        self._state_changed()
 
         _LOGGER.debug(
             "%s new pending updates: %s",
@@ -617,11 +878,15 @@ class TuyaLocalDevice(object):
         )
 
     def _remove_properties_from_pending_updates(self, data):
-        self._pending_updates = {
-            key: value
+        confirmed = [
+            key
             for key, value in self._pending_updates.items()
-            if key not in data or not value["sent"] or data[key] != value["value"]
-        }
+            if key in data and value["sent"] and data[key] == value["value"]
+        ]
+        for key in confirmed:
+            del self._pending_updates[key]
+        if confirmed:
+            self._state_changed()
 
     async def _debounce_sending_updates(self):
         now = time()
@@ -646,10 +911,20 @@ class TuyaLocalDevice(object):
             log_json(pending_properties),
         )
 
-        await self._retry_on_failed_connection(
-            lambda: self._set_values(pending_properties),
-            "Failed to update device state.",
-        )
+        if self._gateway:
+            # queue behind other sub-devices sending over the same connection
+            async with self._gateway.send_lock:
+                await self._retry_on_failed_connection(
+                    lambda: self._set_values(pending_properties),
+                    "Failed to update device state.",
+                )
+        else:
+            await self._retry_on_failed_connection(
+                lambda: self._set_values(pending_properties),
+                "Failed to update device state.",
+            )
+        # sending may have replaced the connection being waited on
+        self._wake_receive()
 
     def _set_values(self, properties):
         try:
@@ -686,7 +961,7 @@ class TuyaLocalDevice(object):
         for i in range(connections):
             try:
                 if not self._hass.is_stopping:
-                    retval = await self._hass.async_add_executor_job(func)
+                    retval = await self._async_io(func)
                     if isinstance(retval, dict) and "Error" in retval:
                         last_err_code = retval.get("Err")
                         last_err_msg = retval.get("Error")
@@ -748,33 +1023,41 @@ class TuyaLocalDevice(object):
                     await self._rotate_api_protocol_version()
 
     def _get_cached_state(self):
-        cached_state = self._cached_state.copy()
-        return {**cached_state, **self._get_pending_properties()}
+        """Return a snapshot of the cached state with pending updates applied."""
+        return {**self._cached_state, **self._get_pending_properties()}
 
     def _get_pending_properties(self):
         return {key: prop["value"] for key, prop in self._get_pending_updates().items()}
 
     def _get_unsent_properties(self):
+        # send pending updates ordered by their API identifier
         return {
             key: info["value"]
-            for key, info in self._get_pending_updates().items()
+            for key, info in sorted(
+                self._get_pending_updates().items(), key=lambda x: int(x[0])
+            )
             if not info["sent"]
         }
 
     def _get_pending_updates(self):
-        now = time()
-        # sort pending updates according to their API identifier
-        pending_updates_sorted = sorted(
-            self._pending_updates.items(), key=lambda x: int(x[0])
-        )
-        self._pending_updates = {
-            key: value
-            for key, value in pending_updates_sorted
-            if not value["sent"]
-            or now - value.get("updated_at", 0) < self._FAKE_IT_TIMEOUT
-        }
+        self._expire_pending_updates()
         return self._pending_updates
 
+    def _expire_pending_updates(self):
+        """Drop sent updates that the device has not confirmed in time."""
+        now = time()
+        expired = [
+            key
+            for key, value in self._pending_updates.items()
+            if value["sent"]
+            and now - value.get("updated_at", 0) >= self._FAKE_IT_TIMEOUT
+        ]
+        for key in expired:
+            del self._pending_updates[key]
+        if expired:
+            self._expired_updates.update(expired)
+            self._state_changed()
+
     async def _rotate_api_protocol_version(self):
         if self._api_protocol_version_index is None:
             try:
@@ -819,12 +1102,12 @@ class TuyaLocalDevice(object):
         else:
             self._api.disabledetect = True
 
-        await self._hass.async_add_executor_job(
+        await self._async_io(
             self._api.set_version,
             new_version,
         )
         if self._api.parent:
-            await self._hass.async_add_executor_job(
+            await self._async_io(
                 self._api.parent.set_version,
                 new_version,
             )
@@ -853,11 +1136,14 @@ def setup_device(hass: HomeAssistant, config: dict):
         manufacturer=config.get(CONF_MANUFACTURER),
         model=config.get(CONF_MODEL),
     )
-    hass.data[DOMAIN][get_device_id(config)] = {
-        "device": device,
-        "tuyadevice": device._api,
-        "tuyadevicelock": device._api_lock,
-    }
+    # a gateway's entry may already hold the reader shared by its sub-devices
+    hass.data[DOMAIN].setdefault(get_device_id(config), {}).update(
+        {
+            "device": device,
+            "tuyadevice": device._api,
+            "tuyadevicelock": device._api_lock,
+        }
+    )
 
     return device
 
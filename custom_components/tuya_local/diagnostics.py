@@ -18,10 +18,12 @@ from .const import (
     CONF_DEVICE_CID,
     CONF_PROTOCOL_VERSION,
     CONF_TYPE,
+    DATA_IO_POOL,
     DOMAIN,
 )
 from .device import TuyaLocalDevice
 from .helpers.config import get_device_id
+from .helpers.scheduler import poll_scheduler
 
 
 async def async_get_config_entry_diagnostics(
@@ -72,11 +74,7 @@ def _async_get_diagnostics(
 
 def redact_dps(device: TuyaLocalDevice, dps: dict[str, Any]) -> dict[str, Any]:
     """Redact any sensitive data from a list of dps"""
-    sensitive = []
-    for entity in device._children:
-        for dp in entity._config.dps():
-            if dp.sensitive:
-                sensitive.append(dp.id)
+    sensitive = device.sensitive_dps
     return {k: (REDACTED if k in sensitive else v) for (k, v) in dps.items()}
 
 
@@ -85,12 +83,7 @@ def redact_entity(
     entity_id: str,
     state_dict: dict[str, Any],
 ) -> dict[str, Any]:
-    sensitive = []
-    for entity in device._children:
-        if entity._config.config_id == entity_id:
-            for dp in entity._config.dps():
-                if dp.sensitive:
-                    sensitive.append(dp.name)
+    sensitive = device.sensitive_attributes(entity_id)
     return {k: (REDACTED if k in sensitive else v) for (k, v) in state_dict.items()}
 
 
@@ -114,8 +107,13 @@ def _async_device_as_dict(
         "cached_state": redact_dps(device, device._cached_state),
         "pending_state": redact_dps(device, device._pending_updates),
         "connected": device._running,
-        "force_dps": device._force_dps,
+        "force_dps": device.force_dps,
+        "received_dps": device.received_dps_stats,
+        "poll_scheduler": poll_scheduler().stats(),
     }
+    io_pool = hass.data.get(DOMAIN, {}).get(DATA_IO_POOL)
+    if io_pool:
+        data["io_pool"] = io_pool.stats()
 
     device_registry = dr.async_get(hass)
     entity_registry = er.async_get(hass)
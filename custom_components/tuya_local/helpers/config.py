@@ -2,14 +2,26 @@
 Helper for general config
 """
 
+import asyncio
 import logging
 
+from homeassistant.helpers.storage import Store
+
 from .. import DOMAIN
-from ..const import CONF_DEVICE_CID, CONF_DEVICE_ID, CONF_TYPE
-from .device_config import get_config
+from ..const import CONF_DEVICE_CID, CONF_DEVICE_ID, CONF_TYPE, DATA_CATALOG_LOCK
+from .device_config import (
+    config_catalog,
+    config_catalog_signature,
+    get_config,
+    has_config_catalog,
+    restore_config_catalog,
+)
 
 _LOGGER = logging.getLogger(__name__)
 
+CATALOG_STORAGE_VERSION = 1
+CATALOG_STORAGE_KEY = f"{DOMAIN}_config_catalog"
+
 
 async def async_tuya_setup_platform(
     hass, async_add_entities, discovery_info, platform, entity_class
@@ -50,3 +62,39 @@ def get_device_id(config: dict):
     if device_id and device_cid:
         return f"{device_id}/{device_cid}"
     return device_cid or device_id
+
+
+async def async_load_config_catalog(hass):
+    """Make the catalog of device configs ready for matching.
+
+    The catalog is restored from storage when neither the integration nor
+    its device configs have changed since it was saved, otherwise it is
+    rebuilt from the yaml files and saved for next time.
+    """
+    if has_config_catalog():
+        return
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    lock = domain_data.setdefault(DATA_CATALOG_LOCK, asyncio.Lock())
+    async with lock:
+        if has_config_catalog():
+            return
+        store = Store(hass, CATALOG_STORAGE_VERSION, CATALOG_STORAGE_KEY)
+        signature = await hass.async_add_executor_job(config_catalog_signature)
+        saved = await store.async_load()
+        if saved and saved.get("signature") == signature:
+            try:
+                await hass.async_add_executor_job(
+                    restore_config_catalog,
+                    saved["configs"],
+                )
+                return
+            except (KeyError, TypeError, ValueError) as e:
+                _LOGGER.info("Rebuilding config catalog, saved copy unusable: %s", e)
+
+        catalog = await hass.async_add_executor_job(config_catalog)
+        await store.async_save(
+            {
+                "signature": signature,
+                "configs": [summary.as_dict() for summary in catalog],
+            }
+        )
@@ -2,14 +2,22 @@
 Config parser for Tuya Local devices.
 """
 
+import json
 import logging
 from base64 import b64decode, b64encode
+from bisect import bisect_left, bisect_right
 from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
 from fnmatch import fnmatch
+from hashlib import sha256
+from heapq import heappush, heappushpop
 from numbers import Number
-from os import scandir
-from os.path import dirname, exists, join, splitext
+from os import scandir, stat
+from os.path import dirname, join, splitext
+from struct import Struct
+from threading import Lock
+from typing import NamedTuple
 
 from homeassistant.util import slugify
 from homeassistant.util.yaml import load_yaml
@@ -18,6 +26,19 @@ import custom_components.tuya_local.devices as config_dir
 
 _LOGGER = logging.getLogger(__name__)
 
+_DP_TYPES = {
+    "boolean": bool,
+    "integer": int,
+    "string": str,
+    "float": float,
+    "bitfield": int,
+    "json": str,
+    "base64": str,
+    "utf16b64": str,
+    "hex": str,
+    "unixtime": int,
+}
+
 
 def _typematch(vtype, value):
     # Workaround annoying legacy of bool being a subclass of int in Python
@@ -41,6 +62,22 @@ def _typematch(vtype, value):
     return False
 
 
+def _nearest_mapping(numeric, value):
+    """Return the mapping with the value nearest to value, from a list of
+    (value, index, mapping) sorted by value, preferring the lowest index
+    when several are equally near."""
+    pos = bisect_left(numeric, value, key=lambda n: n[0])
+    best = None
+    for neighbour in numeric[max(pos - 1, 0) : pos + 1]:
+        lo = bisect_left(numeric, neighbour[0], key=lambda n: n[0])
+        hi = bisect_right(numeric, neighbour[0], key=lambda n: n[0])
+        for v, i, m in numeric[lo:hi]:
+            d = abs(v - value)
+            if d < float("inf") and (best is None or (d, i) < best[:2]):
+                best = (d, i, m)
+    return best[2] if best else None
+
+
 def _scale_range(r, s):
     "Scale range r by factor s"
     return (r["min"] / s, r["max"] / s)
@@ -98,20 +135,29 @@ def to_signed(val, bits):
 class TuyaDeviceConfig:
     """Representation of a device config for Tuya Local devices."""
 
-    def __init__(self, fname):
+    def __init__(self, fname, summary=None):
         """Initialize the device config.
         Args:
-            fname (string): The filename of the yaml config to load."""
-        _CONFIG_DIR = dirname(config_dir.__file__)
+            fname (string): The filename of the yaml config to load.
+            summary (TuyaConfigSummary): The header of the config, if known.
+
+        The full yaml is only loaded when something beyond the header is
+        needed, such as the entities."""
         self._fname = fname
-        filename = join(_CONFIG_DIR, fname)
-        self._config = load_yaml(filename)
-        _LOGGER.debug("Loaded device config %s", fname)
+        self._loaded = None
+        self._summary = summary
+
+    @property
+    def _config(self):
+        if self._loaded is None:
+            self._loaded = _load_config(self._fname)
+            _LOGGER.debug("Loaded device config %s", self._fname)
+        return self._loaded
 
     @property
     def name(self):
         """Return the friendly name for this device."""
-        return self._config["name"]
+        return self._get_summary().name
 
     @property
     def config(self):
@@ -126,7 +172,7 @@ class TuyaDeviceConfig:
     @property
     def legacy_type(self):
         """Return the legacy conf_type associated with this device."""
-        return self._config.get("legacy_type", self.config_type)
+        return self._get_summary().legacy_type
 
     def all_entities(self):
         """Iterate through all entities for this device."""
@@ -138,102 +184,26 @@ class TuyaDeviceConfig:
     def matches(self, dps, product_ids):
         """Determine whether this config matches the provided dps map or
         product ids."""
-        product_match = False
-        if product_ids:
-            for p in self._config.get("products", []):
-                if p.get("id", "MISSING_ID!?!") in product_ids:
-                    product_match = True
-
-        required_dps = self._get_required_dps()
-
-        missing_dps = [dp for dp in required_dps if dp.id not in dps.keys()]
-        if len(missing_dps) > 0:
-            _LOGGER.debug(
-                "Not match for %s, missing required DPs: %s",
-                self.name,
-                [{dp.id: dp.type.__name__} for dp in missing_dps],
-            )
-
-        incorrect_type_dps = [
-            dp
-            for dp in self._get_all_dps()
-            if dp.id in dps.keys() and not _typematch(dp.type, dps[dp.id])
-        ]
-        if len(incorrect_type_dps) > 0:
-            _LOGGER.debug(
-                "Not match for %s, DPs have incorrect type: %s",
-                self.name,
-                [{dp.id: dp.type.__name__} for dp in incorrect_type_dps],
-            )
-            if product_match:
-                _LOGGER.warning(
-                    "Product matches %s but dps mismatched",
-                    self.name,
-                )
-            return False
-
-        return product_match or len(missing_dps) == 0
+        return self._get_summary().matches(dps, product_ids)
 
     def matches_product(self, product_id):
         """Whether this config lists the given Tuya product id in `products`."""
-        if not product_id:
-            return False
-        return any(p.get("id") == product_id for p in self._config.get("products", []))
+        return self._get_summary().matches_product(product_id)
 
     def _get_all_dps(self):
         all_dps_list = []
         all_dps_list += [d for dev in self.all_entities() for d in dev.dps()]
         return all_dps_list
 
-    def _get_required_dps(self):
-        required_dps_list = [d for d in self._get_all_dps() if not d.optional]
-        return required_dps_list
-
-    def _entity_match_analyse(self, entity, keys, matched, dps, product_match):
-        """
-        Determine whether this entity can be a match for the dps
-          Args:
-            entity - the TuyaEntityConfig to check against
-            keys - the unmatched keys for the device
-            matched - the matched keys for the device
-            dps - the dps values to be matched
-        Side Effects:
-            Moves items from keys to matched if they match dps
-        Return Value:
-            True if all dps in entity could be matched to dps, False otherwise
-        """
-        all_dp = keys + matched
-        for d in entity.dps():
-            if (d.id not in all_dp and not d.optional and not product_match) or (
-                d.id in all_dp and not _typematch(d.type, dps[d.id])
-            ):
-                return False
-            if d.id in keys:
-                matched.append(d.id)
-                keys.remove(d.id)
-        return True
+    def _get_summary(self):
+        """Return the matching summary of this config."""
+        if self._summary is None:
+            self._summary = TuyaConfigSummary.from_config(self._fname, self._config)
+        return self._summary
 
     def match_quality(self, dps, product_ids=None):
         """Determine the match quality for the provided dps map and product ids."""
-        product_match = 0
-        if product_ids:
-            for p in self._config.get("products", []):
-                if p.get("id", "MISSING_ID!?!") in product_ids:
-                    product_match = 101
-
-        keys = list(dps.keys())
-        matched = []
-        if "updated_at" in keys:
-            keys.remove("updated_at")
-        total = len(keys)
-        if total < 1:
-            return product_match
-
-        for e in self.all_entities():
-            if not self._entity_match_analyse(e, keys, matched, dps, product_match > 0):
-                return 0
-
-        return product_match or round((total - len(keys)) * 100 / total)
+        return self._get_summary().match_quality(dps, product_ids)
 
     def product_display_entries(self, product_ids=None):
         """Return distinct (manufacturer, model) pairs for display in the config flow.
@@ -245,7 +215,7 @@ class TuyaDeviceConfig:
         seen = set()
         result = []
 
-        for p in self._config.get("products", []):
+        for p in self._get_summary().products:
             if product_ids and p.get("id") not in product_ids:
                 continue
             manufacturer = p.get("manufacturer")
@@ -269,6 +239,8 @@ class TuyaEntityConfig:
     def __init__(self, device, config):
         self._device = device
         self._config = config
+        self._dps = None
+        self._dps_by_name = None
 
     @property
     def name(self):
@@ -359,17 +331,33 @@ class TuyaEntityConfig:
         """Return the mode (used by Number entities)."""
         return self._config.get("mode")
 
+    def _materialize_dps(self):
+        """Build the dps of this entity once, with a lookup by name."""
+        if self._dps is None:
+            dps = [TuyaDpsConfig(self, d) for d in self._config["dps"]]
+            by_name = {}
+            for d in dps:
+                by_name.setdefault(d.name, d)
+            self._dps_by_name = by_name
+            self._dps = dps
+        return self._dps
+
     def dps(self):
         """Iterate through the list of dps for this entity."""
-        for d in self._config["dps"]:
-            yield TuyaDpsConfig(self, d)
+        return iter(self._materialize_dps())
 
     def find_dps(self, name):
         """Find a dps with the specified name."""
-        for d in self.dps():
-            if d.name == name:
-                return d
-        return None
+        self._materialize_dps()
+        return self._dps_by_name.get(name)
+
+    def dependencies(self):
+        """Return the ids of all dps that can affect the state of this entity.
+
+        Mappings can only refer to other dps of the same entity, so these
+        are the ids of its own dps.
+        """
+        return frozenset(dp.id for dp in self.dps())
 
     def available(self, device):
         """Return whether this entity should be available, with state as given."""
@@ -393,61 +381,98 @@ class TuyaEntityConfig:
         return not hidden and not self.deprecated
 
 
+class _DpAttributes(NamedTuple):
+    """The static attributes of a dp, read from its config once."""
+
+    id: str
+    name: str
+    rawtype: str
+    type: type | None
+    optional: bool
+    persist: bool
+    force: bool
+    sensitive: bool
+    readonly: bool
+    hidden: bool
+    range: dict | None
+    mask: int | None
+    mask_signed: bool
+    endianness: str
+
+    @classmethod
+    def from_config(cls, config):
+        mask = config.get("mask")
+        return cls(
+            id=str(config.get("id")),
+            name=config.get("name"),
+            rawtype=config.get("type"),
+            type=_DP_TYPES.get(config.get("type")),
+            optional=config.get("optional", False),
+            persist=config.get("persist", True),
+            force=config.get("force", False),
+            sensitive=config.get("sensitive", False),
+            readonly=config.get("readonly", False),
+            hidden=config.get("hidden", False),
+            range=config.get("range"),
+            mask=int(mask, 16) if mask else None,
+            mask_signed=config.get("mask_signed", False),
+            endianness=config.get("endianness", "big"),
+        )
+
+
 class TuyaDpsConfig:
     """Representation of a dps config."""
 
     def __init__(self, entity, config):
         self._entity = entity
         self._config = config
+        self._attrs = _DpAttributes.from_config(config)
         self.stringify = False
+        self._forward_table = None
+        self._reverse_table = None
+        self._format = None
+        self._value_cache = None
+        self._decoded_cache = None
 
     @property
     def id(self):
-        return str(self._config["id"])
+        return self._attrs.id
 
     @property
     def type(self):
-        t = self._config["type"]
-        types = {
-            "boolean": bool,
-            "integer": int,
-            "string": str,
-            "float": float,
-            "bitfield": int,
-            "json": str,
-            "base64": str,
-            "utf16b64": str,
-            "hex": str,
-            "unixtime": int,
-        }
-        return types.get(t)
+        return self._attrs.type
 
     @property
     def rawtype(self):
-        return self._config["type"]
+        return self._attrs.rawtype
 
     @property
     def name(self):
-        return self._config["name"]
+        return self._attrs.name
 
     @property
     def optional(self):
-        return self._config.get("optional", False)
+        return self._attrs.optional
 
     @property
     def persist(self):
-        return self._config.get("persist", True)
+        return self._attrs.persist
 
     @property
     def force(self):
-        return self._config.get("force", False)
+        return self._attrs.force
 
     @property
     def sensitive(self):
-        return self._config.get("sensitive", False)
+        return self._attrs.sensitive
 
     @property
     def format(self):
+        if self._format is None:
+            self._format = self._compile_format() or False
+        return self._format or None
+
+    def _compile_format(self):
         fmt = self._config.get("format")
         if fmt:
             unpack_fmt = ">"
@@ -468,23 +493,37 @@ class TuyaDpsConfig:
                 ranges.append({"min": mn, "max": mx})
                 names.append(name)
             _LOGGER.debug("format of %s found", unpack_fmt)
-            return {"format": unpack_fmt, "ranges": ranges, "names": names}
+            return {
+                "format": unpack_fmt,
+                "struct": Struct(unpack_fmt),
+                "ranges": ranges,
+                "names": names,
+            }
 
         return None
 
     @property
     def mask(self):
-        mask = self._config.get("mask")
-        if mask:
-            return int(mask, 16)
+        return self._attrs.mask
 
     @property
     def endianness(self):
-        endianness = self._config.get("endianness", "big")
-        return endianness
+        return self._attrs.endianness
 
     def get_value(self, device):
         """Return the value of the dps from the given device."""
+        generation = getattr(device, "state_generation", None)
+        if type(generation) is not int:
+            return self._get_value(device)
+        cached = self._value_cache
+        if cached and cached[0] is device and cached[1] == generation:
+            self.stringify = cached[3]
+            return cached[2]
+        value = self._get_value(device)
+        self._value_cache = (device, generation, value, self.stringify)
+        return value
+
+    def _get_value(self, device):
         mask = self.mask
         # Get raw value directly avoiding accidental scaling by decoded_value()
         raw_from_device = device.get_property(self.id)
@@ -496,7 +535,7 @@ class TuyaDpsConfig:
             raw_result = (value & mask) // scale
 
             # Insert signed interpretation here
-            if self._config.get("mask_signed", False):
+            if self._attrs.mask_signed:
                 # Count how many bits are set in the mask
                 bit_count = mask.bit_count()
                 raw_result = to_signed(raw_result, bit_count)
@@ -513,6 +552,18 @@ class TuyaDpsConfig:
             return self._map_from_dps(raw_from_device, device)
 
     def decoded_value(self, device):
+        generation = getattr(device, "state_generation", None)
+        if type(generation) is not int:
+            return self._decoded_value(device)
+        cached = self._decoded_cache
+        if cached and cached[0] is device and cached[1] == generation:
+            self.stringify = cached[3]
+            return cached[2]
+        value = self._decoded_value(device)
+        self._decoded_cache = (device, generation, value, self.stringify)
+        return value
+
+    def _decoded_value(self, device):
         v = self._map_from_dps(device.get_property(self.id), device)
         return self.decode_value(v, device)
 
@@ -663,7 +714,7 @@ class TuyaDpsConfig:
         """Return the range for this dps if configured."""
         scale = self.scale(device) if scaled else 1
         mapping = self._find_map_for_dps(device.get_property(self.id), device)
-        r = self._config.get("range")
+        r = self._attrs.range
         if mapping:
             r = mapping.get("range", r)
             if scaled and "target_range" in mapping:
@@ -724,7 +775,7 @@ class TuyaDpsConfig:
 
     @property
     def readonly(self):
-        return self._config.get("readonly", False)
+        return self._attrs.readonly
 
     def invalid_for(self, value, device):
         mapping = self._find_map_for_value(value, device)
@@ -736,7 +787,7 @@ class TuyaDpsConfig:
 
     @property
     def hidden(self):
-        return self._config.get("hidden", False)
+        return self._attrs.hidden
 
     @property
     def unit(self):
@@ -747,7 +798,56 @@ class TuyaDpsConfig:
         """The state class of this measurement."""
         return self._config.get("class")
 
+    def _compile_mapping(self):
+        """Compile the mapping into lookup tables, where that is possible.
+
+        Mappings that depend on the device state, through available guards,
+        conditions or mirrored values, and bitfield matching, are left to
+        the linear scan of the mapping.
+        """
+        mappings = self._config.get("mapping", [])
+        dynamic = self.rawtype == "bitfield" or any(
+            "available" in m
+            or "conditions" in m
+            or ("value_mirror" in m and "value" not in m)
+            for m in mappings
+        )
+        if dynamic:
+            self._forward_table = self._reverse_table = False
+            return
+
+        forward = {}
+        forward_default = None
+        exact = {}
+        numeric = []
+        reverse_default = None
+        for i, m in enumerate(mappings):
+            if "dps_val" not in m:
+                forward_default = m
+            else:
+                forward.setdefault(str(m["dps_val"]), m)
+            if m.get("hidden", False):
+                continue
+            if "dps_val" not in m:
+                reverse_default = m
+            if m.get("dps_val") is None or "value" not in m:
+                continue
+            exact.setdefault(str(m["value"]), m)
+            if isinstance(m["value"], Number):
+                numeric.append((m["value"], i, m))
+        numeric.sort(key=lambda n: (n[0], n[1]))
+        self._forward_table = (forward, forward_default)
+        self._reverse_table = (exact, numeric, reverse_default)
+
     def _find_map_for_dps(self, value, device):
+        if self._forward_table is None:
+            self._compile_mapping()
+        if self._forward_table:
+            table, default = self._forward_table
+            return table.get(str(value), default)
+        return self._scan_map_for_dps(value, device)
+
+    def _scan_map_for_dps(self, value, device):
         default = None
         for m in self._config.get("mapping", {}):
             if not self.mapping_available(m, device) and "conditions" not in m:
@@ -834,13 +934,13 @@ class TuyaDpsConfig:
                     return r_dps.get_value(device)
 
             if invert and isinstance(result, Number):
-                r = self._config.get("range")
+                r = self._attrs.range
                 if r and "min" in r and "max" in r:
                     result = -1 * result + r["min"] + r["max"]
                     replaced = True
 
             if target_range and isinstance(result, Number):
-                r = self._config.get("range")
+                r = self._attrs.range
                 if r and "max" in r and "max" in target_range:
                     from_min = r.get("min", 0)
                     from_max = r["max"]
@@ -874,6 +974,22 @@ class TuyaDpsConfig:
         return result
 
     def _find_map_for_value(self, value, device):
+        if self._reverse_table is None:
+            self._compile_mapping()
+        if not self._reverse_table:
+            return self._scan_map_for_value(value, device)
+
+        exact, numeric, default = self._reverse_table
+        m = exact.get(str(value))
+        if m is not None:
+            return m
+        if isinstance(value, Number) and numeric:
+            nearest = _nearest_mapping(numeric, value)
+            if nearest:
+                return nearest
+        return default
+
+    def _scan_map_for_value(self, value, device):
         default = None
         nearest = None
         distance = float("inf")
@@ -1077,7 +1193,7 @@ class TuyaDpsConfig:
                 replaced = True
 
             if target_range and isinstance(result, Number):
-                r = self._config.get("range")
+                r = self._attrs.range
                 if r and "max" in r and "max" in target_range:
                     from_min = target_range.get("min", 0)
                     from_max = target_range["max"]
@@ -1089,7 +1205,7 @@ class TuyaDpsConfig:
                     replaced = True
 
             if invert:
-                r = self._config.get("range")
+                r = self._attrs.range
                 if r and "min" in r and "max" in r:
                     result = -1 * result + r["min"] + r["max"]
                     replaced = True
@@ -1176,6 +1292,471 @@ class TuyaDpsConfig:
         return {"priority": priority, "icon": icon}
 
 
+def _dp_mask(dp_ids):
+    """Return an integer bitmask with the bits for the numeric dp_ids set.
+
+    Other ids are matched as sets instead, so that masks are the same in
+    every process that builds them."""
+    mask = 0
+    for dp_id in dp_ids:
+        if dp_id.isdigit():
+            mask |= 1 << int(dp_id)
+    return mask
+
+
+class DpsMask:
+    """A device's dps encoded as bitmasks, for scoring against configs.
+
+    Encoding once lets the same dps be scored against many configs with
+    integer operations, instead of set lookups and type checks per config.
+    """
+
+    def __init__(self, dps):
+        keys = [k for k in dps if k != "updated_at"]
+        self.total = len(keys)
+        self.keys = 0
+        # values of the dps with ids that are not numbers
+        self.named = {}
+        self.compatible = {t: 0 for t in set(_DP_TYPES.values())}
+        for k in keys:
+            if not isinstance(k, str):
+                continue
+            if not k.isdigit():
+                self.named[k] = dps[k]
+                continue
+            bit = 1 << int(k)
+            self.keys |= bit
+            for t in self.compatible:
+                if _typematch(t, dps[k]):
+                    self.compatible[t] |= bit
+
+
+class TuyaConfigSummary:
+    """The parts of a device config needed to match it against a device."""
+
+    def __init__(self, fname, name, products, dps, legacy_type=None):
+        """Initialize the summary.
+        Args:
+            fname (string): The filename of the yaml config summarised.
+            name (string): The friendly name of the config.
+            products (list): The products listed by the config.
+            dps (list): (id, type, optional) for each dp of each entity.
+            legacy_type (string): The legacy conf_type of the config, if any."""
+        self._fname = fname
+        self._name = name
+        self._legacy_type = legacy_type
+        self._products = products
+        self._product_ids = {p["id"] for p in products if p.get("id")}
+        self._dps = dps
+        self._typed_dps = [(str(i), _DP_TYPES.get(t), opt) for i, t, opt in dps]
+        self._required_ids = frozenset(i for i, _, opt in self._typed_dps if not opt)
+        self._required_mask = _dp_mask(self._required_ids)
+        self._all_mask = _dp_mask(i for i, _, _ in self._typed_dps)
+        self._untyped_mask = _dp_mask(i for i, t, _ in self._typed_dps if t is None)
+        self._type_masks = {}
+        for i, t, _ in self._typed_dps:
+            if t is not None and i.isdigit():
+                self._type_masks[t] = self._type_masks.get(t, 0) | 1 << int(i)
+        self._named_dps = {(i, t) for i, t, _ in self._typed_dps if not i.isdigit()}
+        self._named_ids = frozenset(i for i, _ in self._named_dps)
+        self._named_required = self._named_ids & self._required_ids
+
+    @classmethod
+    def from_config(cls, fname, config):
+        """Summarise a loaded yaml config."""
+        return cls(
+            fname,
+            config.get("name"),
+            [dict(p) for p in config.get("products", [])],
+            [
+                (str(d["id"]), d["type"], d.get("optional", False))
+                for e in config.get("entities")
+                for d in e["dps"]
+            ],
+            config.get("legacy_type"),
+        )
+
+    def as_dict(self):
+        """Return the summary as json serializable data, for saving."""
+        return {
+            "config": self._fname,
+            "name": self._name,
+            "legacy_type": self._legacy_type,
+            "products": self._products,
+            "dps": [list(d) for d in self._dps],
+        }
+
+    @classmethod
+    def from_dict(cls, data):
+        """Restore a summary saved by as_dict."""
+        return cls(
+            data["config"],
+            data["name"],
+            data["products"],
+            [tuple(d) for d in data["dps"]],
+            data["legacy_type"],
+        )
+
+    @property
+    def name(self):
+        """Return the friendly name of the config."""
+        return self._name
+
+    @property
+    def config(self):
+        """Return the config file summarised."""
+        return self._fname
+
+    @property
+    def config_type(self):
+        """Return the config type summarised."""
+        return splitext(self._fname)[0]
+
+    @property
+    def legacy_type(self):
+        """Return the legacy conf_type associated with the config."""
+        return self._legacy_type or self.config_type
+
+    @property
+    def products(self):
+        """Return the products listed by the config."""
+        return self._products
+
+    @property
+    def product_ids(self):
+        """Return the product ids listed by the config."""
+        return self._product_ids
+
+    @property
+    def required_ids(self):
+        """Return the ids of the dps that are required by the config."""
+        return self._required_ids
+
+    @property
+    def dp_signature(self):
+        """Return the distinct (id, type) pairs of the dps in the config."""
+        return {(i, t) for i, t, _ in self._typed_dps}
+
+    def matches_product(self, product_id):
+        """Whether this config lists the given Tuya product id in `products`."""
+        return bool(product_id) and product_id in self._product_ids
+
+    def _product_match(self, product_ids):
+        return bool(product_ids) and not self._product_ids.isdisjoint(product_ids)
+
+    def matches(self, dps, product_ids):
+        """Determine whether this config matches the provided dps map or
+        product ids."""
+        product_match = self._product_match(product_ids)
+
+        missing_dps = [
+            (i, t)
+            for i, t, optional in self._typed_dps
+            if not optional and i not in dps
+        ]
+        if len(missing_dps) > 0:
+            _LOGGER.debug(
+                "Not match for %s, missing required DPs: %s",
+                self.name,
+                [{i: t.__name__} for i, t in missing_dps],
+            )
+
+        incorrect_type_dps = [
+            (i, t)
+            for i, t, _ in self._typed_dps
+            if i in dps and not _typematch(t, dps[i])
+        ]
+        if len(incorrect_type_dps) > 0:
+            _LOGGER.debug(
+                "Not match for %s, DPs have incorrect type: %s",
+                self.name,
+                [{i: t.__name__} for i, t in incorrect_type_dps],
+            )
+            if product_match:
+                _LOGGER.warning(
+                    "Product matches %s but dps mismatched",
+                    self.name,
+                )
+            return False
+
+        return product_match or len(missing_dps) == 0
+
+    def match_quality(self, dps, product_ids=None):
+        """Determine the match quality for the provided dps map and product ids."""
+        return self.score(DpsMask(dps), product_ids)
+
+    def best_score(self, mask, product_ids=None):
+        """Return an upper bound of score(mask, product_ids), cheaply."""
+        if self._product_match(product_ids):
+            return 101
+        if mask.total < 1:
+            return 0
+        present = (self._all_mask & mask.keys).bit_count()
+        present += len(self._named_ids.intersection(mask.named))
+        return round(present * 100 / mask.total)
+
+    def score(self, mask, product_ids=None):
+        """Determine the match quality for dps already encoded as a DpsMask."""
+        product_match = 101 if self._product_match(product_ids) else 0
+        if mask.total < 1:
+            return product_match
+
+        present = self._all_mask & mask.keys
+        named = self._named_ids.intersection(mask.named)
+        if self._untyped_mask & present:
+            raise TypeError(f"Unknown dp type in {self._fname}")
+        for t, type_mask in self._type_masks.items():
+            if type_mask & present & ~mask.compatible[t]:
+                return 0
+        for i, t in self._named_dps:
+            if i in named:
+                if t is None:
+                    raise TypeError(f"Unknown dp type in {self._fname}")
+                if not _typematch(t, mask.named[i]):
+                    return 0
+        if not product_match and (
+            self._required_mask & ~mask.keys or not self._named_required <= named
+        ):
+            return 0
+
+        return product_match or round(
+            (present.bit_count() + len(named)) * 100 / mask.total
+        )
+
+
+class TuyaConfigCatalog:
+    """An index of the available device configs, used for matching."""
+
+    def __init__(self, summaries):
+        self._summaries = {s.config_type: s for s in summaries}
+        self._position = {t: i for i, t in enumerate(self._summaries)}
+        self._by_product = {}
+        self._by_legacy_type = {}
+        # dp id -> configs that require it
+        self._requiring = {}
+        # dp id -> type -> configs that have a dp of that type with that id
+        self._by_dp = {}
+        # configs with only optional dps, which match any dps
+        self._unconstrained = []
+        for s in self._summaries.values():
+            self._by_legacy_type.setdefault(s.legacy_type, s)
+            for product_id in s.product_ids:
+                self._by_product.setdefault(product_id, []).append(s)
+            for dp_id in s.required_ids:
+                self._requiring.setdefault(dp_id, []).append(s)
+            if not s.required_ids:
+                self._unconstrained.append(s)
+            for dp_id, dp_type in s.dp_signature:
+                if dp_type is not None:
+                    types = self._by_dp.setdefault(dp_id, {})
+                    types.setdefault(dp_type, []).append(s)
+
+    @classmethod
+    def build(cls, workers=None):
+        """Build the catalog by summarising each available config.
+
+        If workers is more than 1, the configs are parsed in that many
+        processes, and merged in the same order as a serial build."""
+        cfgs = list(available_configs())
+        if workers and workers > 1:
+            with ProcessPoolExecutor(workers) as pool:
+                summaries = list(pool.map(_summarise, cfgs, chunksize=32))
+        else:
+            summaries = map(_summarise, cfgs)
+        return cls(s for s in summaries if s is not None)
+
+    def __len__(self):
+        return len(self._summaries)
+
+    def __iter__(self):
+        return iter(self._summaries.values())
+
+    def get(self, config_type):
+        """Return the summary for config_type, if available."""
+        return self._summaries.get(config_type)
+
+    def for_legacy_type(self, legacy_type):
+        """Return the first summary with legacy_type, if any."""
+        return self._by_legacy_type.get(legacy_type)
+
+    def for_products(self, product_ids):
+        """Return the summaries of configs listing any of product_ids."""
+        found = set()
+        for product_id in product_ids or []:
+            found.update(self._by_product.get(product_id, []))
+        return self._in_catalog_order(found)
+
+    def candidates(self, dps):
+        """Return the configs whose dp signature is compatible with dps.
+
+        Required dps must all be present, and any dps present must be of a
+        compatible type.  Only the configs sharing dps with the device are
+        visited, rather than the whole catalog.
+        """
+        present = {}
+        rejected = set()
+        for dp_id, value in dps.items():
+            for s in self._requiring.get(dp_id, []):
+                present[s] = present.get(s, 0) + 1
+            for dp_type, summaries in self._by_dp.get(dp_id, {}).items():
+                if not _typematch(dp_type, value):
+                    rejected.update(summaries)
+
+        found = {s for s, n in present.items() if n == len(s.required_ids)}
+        found.update(self._unconstrained)
+        return self._in_catalog_order(found - rejected)
+
+    def _in_catalog_order(self, summaries):
+        return sorted(summaries, key=lambda s: self._position[s.config_type])
+
+    def possible_matches(self, dps, product_ids=None):
+        """Iterate through the summaries matching dps and product_ids, in
+        catalog order."""
+        matched = self._matching(self.for_products(product_ids), dps, product_ids)
+        matched += self._matching(self._alternatives(dps, matched), dps, product_ids)
+        yield from self._in_catalog_order(matched)
+
+    def rank(self, dps, product_ids=None, k=None):
+        """Return (summary, quality) for the configs matching dps and
+        product_ids, best first, and in catalog order for equal quality.
+
+        If k is given, only the top k are returned, and candidates whose
+        best possible score cannot reach the top k are not examined.  The
+        configs listing a product id are examined first, and the configs
+        matching only by dps are not looked up when they fill the top k.
+        """
+        mask = DpsMask(dps)
+        top = []
+        matched = self._matching(self.for_products(product_ids), dps, product_ids)
+        candidates = [(s, True) for s in matched]
+        if not k or len(matched) < k:
+            # product ids are not unique to a device, so also offer the
+            # configs matching by dps, which score below the product matches
+            others = self._alternatives(dps, matched)
+            others.sort(key=lambda s: s.best_score(mask, product_ids), reverse=True)
+            candidates += [(s, False) for s in others]
+
+        for summary, verified in candidates:
+            if k and len(top) >= k:
+                if summary.best_score(mask, product_ids) < top[0][0]:
+                    break
+            if not verified and not self._matching([summary], dps, product_ids):
+                continue
+            try:
+                quality = summary.score(mask, product_ids)
+            except TypeError:
+                _LOGGER.error("Parse error in %s", summary.config)
+                continue
+            entry = (quality, -self._position[summary.config_type], summary)
+            if k and len(top) >= k:
+                heappushpop(top, entry)
+            else:
+                heappush(top, entry)
+
+        return [(s, q) for q, _, s in sorted(top, reverse=True)]
+
+    def _alternatives(self, dps, matched):
+        """Return the candidates for dps that are not already matched."""
+        return [s for s in self.candidates(dps) if s not in matched]
+
+    def _matching(self, summaries, dps, product_ids):
+        matched = []
+        for summary in summaries:
+            try:
+                if summary.matches(dps, product_ids):
+                    matched.append(summary)
+            except TypeError:
+                _LOGGER.error("Parse error in %s", summary.config)
+        return matched
+
+
+_catalog = None
+_catalog_lock = Lock()
+
+
+def config_catalog(workers=None):
+    """Return the catalog of available configs, building it on first use,
+    in parallel processes if workers is given."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = TuyaConfigCatalog.build(workers)
+            _LOGGER.debug("Indexed %d device configs", len(_catalog))
+    return _catalog
+
+
+def has_config_catalog():
+    """Return whether the catalog of available configs is ready for use."""
+    return _catalog is not None
+
+
+def restore_config_catalog(saved):
+    """Use a catalog saved from TuyaConfigSummary.as_dict data, unless one
+    is already in use."""
+    global _catalog
+    with _catalog_lock:
+        if _catalog is None:
+            _catalog = TuyaConfigCatalog(TuyaConfigSummary.from_dict(d) for d in saved)
+            _LOGGER.debug("Restored %d device configs", len(_catalog))
+    return _catalog
+
+
+def config_catalog_signature():
+    """Return a hash identifying the version of the integration and the
+    state of its device config files, to detect when a catalog is stale."""
+    _CONFIG_DIR = dirname(config_dir.__file__)
+    signature = sha256(_integration_version().encode())
+    with scandir(_CONFIG_DIR) as entries:
+        files = sorted(
+            (e.name, e.stat().st_size, e.stat().st_mtime_ns)
+            for e in entries
+            if e.is_file() and e.name.endswith(".yaml")
+        )
+    for name, size, mtime in files:
+        signature.update(f"{name}:{size}:{mtime}\n".encode())
+    return signature.hexdigest()
+
+
+def _integration_version():
+    manifest = join(dirname(dirname(__file__)), "manifest.json")
+    with open(manifest, encoding="utf-8") as f:
+        return json.load(f).get("version", "")
+
+
+def _summarise(fname):
+    """Summarise a config file, or log why it cannot be indexed."""
+    try:
+        return TuyaConfigSummary.from_config(fname, _load_config(fname))
+    except Exception as e:
+        _LOGGER.error("Unable to index %s: %s", fname, e)
+
+
+def load_configs(fnames, workers=None):
+    """Iterate through fully loaded configs for fnames, in order.
+
+    If workers is more than 1, the files are parsed in that many processes.
+    """
+    fnames = list(fnames)
+    if not workers or workers < 2:
+        for fname in fnames:
+            yield TuyaDeviceConfig(fname)
+        return
+
+    with ProcessPoolExecutor(workers) as pool:
+        for fname, loaded in zip(
+            fnames, pool.map(_load_config, fnames, chunksize=32), strict=True
+        ):
+            config = TuyaDeviceConfig(fname)
+            config._loaded = loaded
+            yield config
+
+
+def _load_config(fname):
+    """Load the yaml for a config file."""
+    _CONFIG_DIR = dirname(config_dir.__file__)
+    return load_yaml(join(_CONFIG_DIR, fname))
+
+
 def available_configs():
     """List the available config files."""
     _CONFIG_DIR = dirname(config_dir.__file__)
@@ -1188,26 +1769,49 @@ def available_configs():
 def possible_matches(dps, product_ids=None):
     """Return possible matching configs for a given set of
     dps values and product_ids."""
-    for cfg in available_configs():
-        parsed = TuyaDeviceConfig(cfg)
-        try:
-            if parsed.matches(dps, product_ids):
-                yield parsed
-        except TypeError:
-            _LOGGER.error("Parse error in %s", cfg)
+    for summary in config_catalog().possible_matches(dps, product_ids):
+        yield _cached_config(summary.config_type, summary)
+
+
+# Parsed configs shared by all devices using them, keyed by config_type.
+# Each is stored with the mtime of its file, so edits are picked up.
+_config_cache = {}
+
+
+def rank_matches(dps, product_ids=None, k=None):
+    """Return (config, quality) pairs for the configs matching dps and
+    product_ids, best match first.  If k is given, return only the top k."""
+    return [
+        (_cached_config(summary.config_type, summary), quality)
+        for summary, quality in config_catalog().rank(dps, product_ids, k)
+    ]
 
 
 def get_config(conf_type):
     """
     Return a config to use with config_type.
     """
+    config = _cached_config(conf_type)
+    if config is None:
+        return config_for_legacy_use(conf_type)
+    return config
+
+
+def _cached_config(conf_type, summary=None):
+    """Return the shared config for conf_type, or None if there is no file."""
     _CONFIG_DIR = dirname(config_dir.__file__)
     fname = conf_type + ".yaml"
-    fpath = join(_CONFIG_DIR, fname)
-    if exists(fpath):
-        return TuyaDeviceConfig(fname)
-    else:
-        return config_for_legacy_use(conf_type)
+    try:
+        mtime = stat(join(_CONFIG_DIR, fname)).st_mtime_ns
+    except OSError:
+        return None
+
+    cached = _config_cache.get(conf_type)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    config = TuyaDeviceConfig(fname, summary)
+    _config_cache[conf_type] = (mtime, config)
+    return config
 
 
 def config_for_legacy_use(conf_type):
@@ -1217,9 +1821,7 @@ def config_for_legacy_use(conf_type):
     to be the correct config for the device, so only use it for looking up
     the legacy class during the transition period.
     """
-    for cfg in available_configs():
-        parsed = TuyaDeviceConfig(cfg)
-        if parsed.legacy_type == conf_type:
-            return parsed
-
-    return None
+    summary = config_catalog().for_legacy_type(conf_type)
+    if summary is None:
+        return None
+    return _cached_config(summary.config_type, summary)
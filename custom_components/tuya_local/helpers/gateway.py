@@ -0,0 +1,146 @@
+"""
+Shared reading of gateway connections for sub-devices
+"""
+
+import asyncio
+import logging
+
+from .io_pool import async_wait_readable, device_io_pool, has_data
+from .log import log_json
+
+_LOGGER = logging.getLogger(__name__)
+
+# Messages kept for a sub-device that is not reading them
+_QUEUE_SIZE = 100
+# How long to wait before reading again when not connected or after errors
+_IDLE_WAIT = 1
+_ERROR_WAIT = 5
+
+
+class GatewayReader:
+    """A single reader of a gateway connection for all of its sub-devices.
+
+    Messages read from the gateway are delivered to the sub-device with a
+    matching cid, and messages without a cid to the gateway itself if it is
+    also in use as a device.  Sub-devices wait for messages on their own
+    queue instead of taking turns reading from the shared connection.
+    """
+
+    def __init__(self, hass, api, lock):
+        self._hass = hass
+        self._api = api
+        self._lock = lock
+        self._queues = {}
+        self._task = None
+        # serialises sending from sub-devices over the shared connection
+        self.send_lock = asyncio.Lock()
+
+    @property
+    def api(self):
+        """The tinytuya device for the gateway connection."""
+        return self._api
+
+    def subscribe(self, cid):
+        """Start delivering messages for cid, reading from the gateway if
+        not already doing so."""
+        if cid not in self._queues:
+            self._queues[cid] = asyncio.Queue(_QUEUE_SIZE)
+        if self._task is None or self._task.done():
+            self._task = self._hass.async_create_background_task(
+                self._async_read_loop(),
+                f"tuya_local gateway {self._api.id}",
+            )
+
+    def subscribed(self, cid):
+        """Return whether messages for cid are being delivered."""
+        return cid in self._queues
+
+    def unsubscribe(self, cid):
+        """Stop delivering messages for cid, and stop reading from the
+        gateway once nothing is subscribed."""
+        self._queues.pop(cid, None)
+        if not self._queues and self._task:
+            self._task.cancel()
+            self._task = None
+
+    async def async_receive(self, cid, timeout, wake=None):
+        """Return the next message for cid, or None if none arrives before
+        timeout or, if given, the future wake is completed."""
+        queue = self._queues.get(cid)
+        if queue is None:
+            return None
+        if not queue.empty():
+            return queue.get_nowait()
+        getter = asyncio.ensure_future(queue.get())
+        waits = {getter} if wake is None else {getter, wake}
+        try:
+            await asyncio.wait(
+                waits, timeout=max(timeout, 0), return_when=asyncio.FIRST_COMPLETED
+            )
+        finally:
+            getter.cancel()
+        if getter.done() and not getter.cancelled():
+            return getter.result()
+        return None
+
+    async def _async_read_loop(self):
+        while self._queues:
+            try:
+                if self._api.socket is None:
+                    # sub-devices establish the connection when polling
+                    await asyncio.sleep(_IDLE_WAIT)
+                    continue
+                if await async_wait_readable(self._api, _IDLE_WAIT) is False:
+                    continue
+                async with self._lock:
+                    # a sub-device polling while waiting for the lock may
+                    # have read the data already
+                    if not has_data(self._api):
+                        continue
+                    msg = await device_io_pool(self._hass).async_run(self._api.receive)
+                self._dispatch(msg)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                _LOGGER.exception(
+                    "Gateway %s read error %s:%s", self._api.id, type(e).__name__, e
+                )
+                await asyncio.sleep(_ERROR_WAIT)
+
+    def _dispatch(self, msg):
+        child = None
+        if isinstance(msg, tuple):
+            # queued by tinytuya while a sub-device was reading
+            child, msg = msg
+        if not isinstance(msg, dict):
+            return
+        if "Error" in msg:
+            # Payload error 904 means no new data on 3.4 protocol devices
+            if msg.get("Err") != "904":
+                for queue in self._queues.values():
+                    self._put(queue, msg)
+            return
+
+        child = msg.pop("device", child)
+        cid = getattr(child, "cid", None) or msg.get("cid")
+        if not cid and isinstance(msg.get("data"), dict):
+            cid = msg["data"].get("cid")
+        queue = self._queues.get(cid)
+        if queue is None:
+            queue = self._queues.get(None)
+        if queue is None:
+            _LOGGER.debug(
+                "Gateway %s received message for unknown cid %s: %s",
+                self._api.id,
+                cid,
+                log_json(msg),
+            )
+            return
+        self._put(queue, msg)
+
+    @staticmethod
+    def _put(queue, msg):
+        if queue.full():
+            # drop the oldest message rather than block the gateway
+            queue.get_nowait()
+        queue.put_nowait(msg)
@@ -0,0 +1,144 @@
+"""
+Helpers for blocking communication with devices
+"""
+
+import asyncio
+import select
+from concurrent.futures import ThreadPoolExecutor
+from threading import Lock
+from time import monotonic
+
+from homeassistant.const import EVENT_HOMEASSISTANT_STOP
+from homeassistant.core import HomeAssistant, callback
+
+from ..const import DATA_IO_POOL, DEFAULT_IO_WORKERS, DOMAIN
+
+
+class DeviceIoPool:
+    """A bounded pool of threads for tinytuya calls.
+
+    Keeping device communication off Home Assistant's shared executor
+    means a burst of unreachable devices waiting for timeouts cannot hold
+    up other integrations.
+    """
+
+    def __init__(self, max_workers=DEFAULT_IO_WORKERS):
+        self._max_workers = max_workers
+        self._executor = ThreadPoolExecutor(
+            max_workers, thread_name_prefix="tuya_local_io"
+        )
+        self._lock = Lock()
+        self._queued = 0
+        self._running = 0
+        self._jobs = 0
+        self._total_wait = 0.0
+        self._max_wait = 0.0
+
+    async def async_run(self, func, *args):
+        """Run func with args in the pool, returning its result."""
+        submitted = monotonic()
+
+        def job():
+            wait = monotonic() - submitted
+            with self._lock:
+                self._queued -= 1
+                self._running += 1
+                self._jobs += 1
+                self._total_wait += wait
+                self._max_wait = max(self._max_wait, wait)
+            try:
+                return func(*args)
+            finally:
+                with self._lock:
+                    self._running -= 1
+
+        with self._lock:
+            self._queued += 1
+        future = self._executor.submit(job)
+        try:
+            return await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            if future.cancel():
+                # the job will never start
+                with self._lock:
+                    self._queued -= 1
+            raise
+
+    def stats(self):
+        """Return the size, queue depth and wait times of the pool."""
+        with self._lock:
+            return {
+                "workers": self._max_workers,
+                "running": self._running,
+                "queue_depth": self._queued,
+                "average_wait": (
+                    round(self._total_wait / self._jobs, 3) if self._jobs else 0
+                ),
+                "max_wait": round(self._max_wait, 3),
+            }
+
+    def shutdown(self):
+        """Stop the threads once any calls in progress have finished."""
+        self._executor.shutdown(wait=True, cancel_futures=True)
+
+
+async def async_wait_readable(api, timeout, readable=None):
+    """Wait until the connection of a tinytuya device has data to read.
+
+    Returns True when data arrives, or False if nothing arrived before
+    timeout or if readable, the future otherwise completed when data
+    arrives, is completed with False first.  If there is no connection to
+    wait on, returns None immediately so the caller can fall back to a
+    blocking receive.
+    """
+    if api.received_wrong_cid_queue:
+        # messages for sub-devices already received by the gateway
+        return True
+    try:
+        fd = api.socket.fileno()
+    except AttributeError, OSError:
+        return None
+    if not isinstance(fd, int) or fd < 0:
+        return None
+
+    loop = asyncio.get_running_loop()
+    if readable is None:
+        readable = loop.create_future()
+    loop.add_reader(fd, lambda: readable.done() or readable.set_result(True))
+    try:
+        async with asyncio.timeout(max(timeout, 0)):
+            return await readable
+    except TimeoutError:
+        return False
+    finally:
+        loop.remove_reader(fd)
+
+
+def has_data(api):
+    """Return whether the connection of a tinytuya device has data to read
+    now, or True if that cannot be determined, as for async_wait_readable."""
+    if api.received_wrong_cid_queue:
+        return True
+    try:
+        readable, _, _ = select.select([api.socket], [], [], 0)
+    except OSError, TypeError, ValueError:
+        return True
+    return bool(readable)
+
+
+@callback
+def device_io_pool(hass: HomeAssistant):
+    """Return the pool shared by all devices, creating it on first use."""
+    domain_data = hass.data.setdefault(DOMAIN, {})
+    pool = domain_data.get(DATA_IO_POOL)
+    if pool is None:
+        pool = DeviceIoPool()
+        domain_data[DATA_IO_POOL] = pool
+
+        async def async_shutdown(event):
+            if domain_data.get(DATA_IO_POOL) is pool:
+                del domain_data[DATA_IO_POOL]
+            await hass.async_add_executor_job(pool.shutdown)
+
+        hass.bus.async_listen_once(EVENT_HOMEASSISTANT_STOP, async_shutdown)
+    return pool
@@ -0,0 +1,117 @@
+"""
+Scheduling of heartbeats and full polls for all devices
+"""
+
+from threading import Lock
+from time import time
+
+HEARTBEAT = 0
+FULL_POLL = 1
+
+# Successive multiples of this, modulo 1, are spread evenly over [0, 1)
+_GOLDEN_RATIO = 0.6180339887498949
+
+
+class PollScheduler:
+    """Deadlines for the heartbeats and full polls of every device.
+
+    Each device is given a phase within the intervals, so that devices
+    started together send their heartbeats and polls at evenly spread
+    times rather than all in the same slot.
+    """
+
+    def __init__(self, heartbeat_interval=5, full_poll_interval=30):
+        self._intervals = (heartbeat_interval, full_poll_interval)
+        self._deadlines = {}
+        self._phases = {}
+        self._added = 0
+        self._serviced = 0
+        self._total_lag = 0.0
+        self._max_lag = 0.0
+
+    def __len__(self):
+        return len(self._deadlines)
+
+    def add(self, key, now=None):
+        """Schedule a device, with a full poll due straight away."""
+        if key in self._deadlines:
+            return
+        now = time() if now is None else now
+        phase = (self._added * _GOLDEN_RATIO) % 1
+        self._added += 1
+        self._phases[key] = phase
+        self._deadlines[key] = [self._next_slot(HEARTBEAT, phase, now), now]
+
+    def remove(self, key):
+        """Stop scheduling a device."""
+        self._deadlines.pop(key, None)
+        self._phases.pop(key, None)
+
+    def is_due(self, key, kind, now=None):
+        """Return whether the heartbeat or full poll of a device is due."""
+        deadlines = self._deadlines.get(key)
+        if deadlines is None:
+            return True
+        return (time() if now is None else now) >= deadlines[kind]
+
+    def expedite(self, key, kind, now=None):
+        """Make the heartbeat or full poll of a device due now."""
+        deadlines = self._deadlines.get(key)
+        if deadlines is not None:
+            deadlines[kind] = time() if now is None else now
+
+    def done(self, key, kind, now=None):
+        """Record that a heartbeat or full poll was sent, and schedule the next."""
+        deadlines = self._deadlines.get(key)
+        if deadlines is None:
+            return
+        now = time() if now is None else now
+        lag = max(now - deadlines[kind], 0)
+        self._serviced += 1
+        self._total_lag += lag
+        self._max_lag = max(self._max_lag, lag)
+        deadlines[kind] = self._next_slot(kind, self._phases[key], now)
+
+    def interval(self, kind):
+        """Return the time between heartbeats or full polls of a device."""
+        return self._intervals[kind]
+
+    def next_deadline(self, key):
+        """Return the time of the next heartbeat or full poll of a device."""
+        deadlines = self._deadlines.get(key)
+        return min(deadlines) if deadlines else time()
+
+    def stats(self, now=None):
+        """Return the number of overdue deadlines and the lag in servicing them."""
+        now = time() if now is None else now
+        return {
+            "devices": len(self._deadlines),
+            "queue_depth": sum(
+                1 for d in self._deadlines.values() for due in d if due <= now
+            ),
+            "average_lag": (
+                round(self._total_lag / self._serviced, 3) if self._serviced else 0
+            ),
+            "max_lag": round(self._max_lag, 3),
+        }
+
+    def _next_slot(self, kind, phase, now):
+        # the first slot for the device's phase at least half an interval away
+        interval = self._intervals[kind]
+        earliest = now + interval / 2
+        offset = phase * interval
+        cycles = -((offset - earliest) // interval)
+        return offset + cycles * interval
+
+
+_scheduler = None
+_scheduler_lock = Lock()
+
+
+def poll_scheduler():
+    """Return the scheduler shared by all devices."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = PollScheduler()
+    return _scheduler
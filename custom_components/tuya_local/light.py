@@ -3,7 +3,6 @@ Setup for different kinds of Tuya light devices
 """
 
 import logging
-from struct import pack, unpack
 
 import homeassistant.util.color as color_util
 from homeassistant.components.light import (
@@ -37,6 +36,23 @@ async def async_setup_entry(hass, config_entry, async_add_entities):
     )
 
 
+def _color_scales(fmt):
+    """Return the factors scaling each packed colour field to the HA range."""
+    scales = []
+    for n, r in zip(fmt["names"], fmt["ranges"], strict=True):
+        # HA range: s = 0-100, rgbv = 0-255, h = 0-360
+        mx = r["max"]
+        scale = 1
+        if n == "h":
+            scale = 360 / mx
+        elif n == "s":
+            scale = 100 / mx
+        elif n in ["v", "r", "g", "b"]:
+            scale = 255 / mx
+        scales.append(scale)
+    return scales
+
+
 def _ha_brightness_to_dp_value(ha_brightness, dp_range):
     """Convert HA brightness to a clamped device DP value."""
     if ha_brightness == 1 and dp_range[0] != 0:
@@ -67,6 +83,10 @@ class TuyaLocalLight(TuyaLocalEntity, LightEntity):
         self._effect_dps = dps_map.pop("effect", None)
         self._init_end(dps_map)
 
+        self._rgbhsv_scales = None
+        if self._rgbhsv_dps and self._rgbhsv_dps.format:
+            self._rgbhsv_scales = _color_scales(self._rgbhsv_dps.format)
+
         # Set min and max color temp
         if self._color_temp_dps:
             range_set = False
@@ -213,26 +233,13 @@ class TuyaLocalLight(TuyaLocalEntity, LightEntity):
             color = self._rgbhsv_dps.decoded_value(self._device)
             fmt = self._rgbhsv_dps.format
             if fmt and color:
-                vals = unpack(fmt.get("format"), color)
-                idx = 0
-                rgbhsv = {}
-                for v in vals:
-                    # HA range: s = 0-100, rgbv = 0-255, h = 0-360
-                    n = fmt["names"][idx]
-                    r = fmt["ranges"][idx]
-                    mx = r["max"]
-                    scale = 1
-                    if n == "h":
-                        scale = 360 / mx
-                    elif n == "s":
-                        scale = 100 / mx
-                    elif n in ["v", "r", "g", "b"]:
-                        scale = 255 / mx
-
-                    rgbhsv[n] = round(scale * v)
-                    idx += 1
-
-                return rgbhsv
+                vals = fmt["struct"].unpack_from(color)
+                return {
+                    n: round(scale * v)
+                    for n, scale, v in zip(
+                        fmt["names"], self._rgbhsv_scales, vals, strict=True
+                    )
+                }
         elif self._named_color_dps:
             colour = self._named_color_dps.get_value(self._device)
             if colour:
@@ -410,7 +417,7 @@ class TuyaLocalLight(TuyaLocalEntity, LightEntity):
                         val = current[n]
                     ordered.append(val)
                     idx += 1
-                binary = pack(fmt["format"], *ordered)
+                binary = fmt["struct"].pack(*ordered)
                 encoded = self._rgbhsv_dps.encode_value(binary)
                 _LOGGER.info("%s setting color to %s", self._config.config_id, encoded)
                 settings = {
@@ -178,7 +178,7 @@ class TuyaLocalLock(TuyaLocalEntity, LockEntity):
                 # of waiting for the next poll, to make the lock more responsive
                 # to multiple attempts
                 if not dp.persist:
-                    self._device._cached_state.pop(dp.id, None)
+                    self._device.clear_property(dp.id)
                 return by
 
     async def async_lock(self, **kwargs):
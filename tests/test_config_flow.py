@@ -544,10 +544,9 @@ def setup_device_mock(mock, mocker, failure=False, devtype="test"):
     mock_type = mocker.MagicMock()
     mock_type.legacy_type = devtype
     mock_type.config_type = devtype
-    mock_type.match_quality.return_value = 100
     mock_type.product_display_entries.return_value = [(None, None)]
-    mock.async_possible_types = mocker.AsyncMock(
-        return_value=[mock_type] if not failure else []
+    mock.async_ranked_types = mocker.AsyncMock(
+        return_value=[(mock_type, 100)] if not failure else []
     )
 
 
@@ -1629,9 +1628,8 @@ async def test_flow_select_type_shows_auto_detected_form(hass, mocker):
     mock_type = mocker.MagicMock()
     mock_type.config_type = "smartplugv1"
     mock_type.name = "Smart Plug"
-    mock_type.match_quality.return_value = 85
     mock_type.product_display_entries.return_value = [(None, None)]
-    mock_device.async_possible_types = mocker.AsyncMock(return_value=[mock_type])
+    mock_device.async_ranked_types = mocker.AsyncMock(return_value=[(mock_type, 85)])
     mock_device._get_cached_state.return_value = {"1": True}
     mock_device._product_ids = []
 
@@ -1,12 +1,25 @@
 import asyncio
 import logging
+import socket
 from time import time
 
 import pytest
 
 # from homeassistant.const import EVENT_HOMEASSISTANT_STARTED, EVENT_HOMEASSISTANT_STOP
-from custom_components.tuya_local.const import CONF_DEVICE_ID, DOMAIN
-from custom_components.tuya_local.device import TuyaLocalDevice, async_delete_device
+from homeassistant.const import CONF_HOST, CONF_NAME
+
+from custom_components.tuya_local.const import (
+    CONF_DEVICE_ID,
+    CONF_LOCAL_KEY,
+    CONF_POLL_ONLY,
+    CONF_PROTOCOL_VERSION,
+    DOMAIN,
+)
+from custom_components.tuya_local.device import (
+    TuyaLocalDevice,
+    async_delete_device,
+    setup_device,
+)
 
 from .const import EUROM_600_HEATER_PAYLOAD
 
@@ -51,6 +64,20 @@ def subject(patched_hass, mock_api, mocker):
     return subject
 
 
+@pytest.fixture
+def entity_with(mocker):
+    """Return a factory of mock entities with the given dps."""
+
+    def factory(dps, config_id="entity"):
+        entity = mocker.MagicMock()
+        entity._config.config_id = config_id
+        entity._config.dps.side_effect = lambda: iter(dps)
+        entity._config.dependencies.return_value = set()
+        return entity
+
+    return factory
+
+
 def test_name(subject):
     """Returns the name given at instantiation."""
     assert subject.name == "Some name"
@@ -76,6 +103,77 @@ def test_subdevice_unique_id_is_scoped_by_gateway(patched_hass, mock_api):
     assert subject.unique_id == "gateway_id/child_id"
 
 
+def test_sub_devices_share_a_gateway_reader(patched_hass, mock_api):
+    first = TuyaLocalDevice(
+        "First", "gw_id", "some.ip", "some_key", "auto", "cid1", patched_hass
+    )
+    second = TuyaLocalDevice(
+        "Second", "gw_id", "some.ip", "some_key", "auto", "cid2", patched_hass
+    )
+    entry = patched_hass.data[DOMAIN]["gw_id"]
+    gateway = entry["gateway"]
+    assert gateway.api is entry["tuyadevice"]
+    # tinytuya is mocked, so the sub-devices share the mocked parent
+    mock_api.return_value.parent = None
+    assert first._find_gateway() is gateway
+    assert second._find_gateway() is gateway
+
+
+def test_gateway_setup_keeps_reader_of_sub_devices(patched_hass, mock_api):
+    TuyaLocalDevice(
+        "Child", "gw_id", "some.ip", "some_key", "auto", "cid1", patched_hass
+    )
+    gateway = patched_hass.data[DOMAIN]["gw_id"]["gateway"]
+    device = setup_device(
+        patched_hass,
+        {
+            CONF_NAME: "Gateway",
+            CONF_DEVICE_ID: "gw_id",
+            CONF_HOST: "some.ip",
+            CONF_LOCAL_KEY: "some_key",
+            CONF_PROTOCOL_VERSION: "auto",
+            CONF_POLL_ONLY: False,
+        },
+    )
+    entry = patched_hass.data[DOMAIN]["gw_id"]
+    assert entry["device"] is device
+    assert entry["gateway"] is gateway
+
+
+@pytest.mark.asyncio
+async def test_gateway_device_joins_reader_created_later(patched_hass, mock_api):
+    mock_api.return_value.parent = None
+    mock_api.return_value.socket = None
+    gateway_device = setup_device(
+        patched_hass,
+        {
+            CONF_NAME: "Gateway",
+            CONF_DEVICE_ID: "gw_id",
+            CONF_HOST: "some.ip",
+            CONF_LOCAL_KEY: "some_key",
+            CONF_PROTOCOL_VERSION: "auto",
+            CONF_POLL_ONLY: False,
+        },
+    )
+    gateway_device._join_gateway()
+    assert gateway_device._gateway is None
+    gateway_device._receive_waiter = asyncio.get_running_loop().create_future()
+
+    TuyaLocalDevice(
+        "Child", "gw_id", "some.ip", "some_key", "auto", "cid1", patched_hass
+    )
+    await asyncio.sleep(0)
+    # the gateway device stops waiting on the connection itself
+    assert gateway_device._receive_waiter.done()
+    try:
+        gateway_device._join_gateway()
+        gateway = patched_hass.data[DOMAIN]["gw_id"]["gateway"]
+        assert gateway_device._gateway is gateway
+        assert gateway.subscribed(None)
+    finally:
+        gateway_device._leave_gateway()
+
+
 def test_device_info(subject, mock_api):
     """Returns generic info plus the unique ID for categorisation."""
     assert subject.device_info == {
@@ -322,6 +420,15 @@ def test_expired_pending_update_value_does_not_override_cached_value(subject):
     assert subject.get_property("1") is True
 
 
+def test_unsent_properties_are_ordered_by_dp_id(subject):
+    subject._pending_updates = {
+        "10": {"value": 1, "updated_at": time(), "sent": False},
+        "2": {"value": 2, "updated_at": time(), "sent": False},
+        "3": {"value": 3, "updated_at": time(), "sent": True},
+    }
+    assert list(subject._get_unsent_properties()) == ["2", "10"]
+
+
 def test_get_property_returns_none_when_value_does_not_exist(subject):
     subject._cached_state = {"1": True}
     assert subject.get_property("2") is None
@@ -354,6 +461,28 @@ def test_anticipate_property_value_updates_cached_state(subject):
     assert subject._cached_state["1"] is False
 
 
+def test_state_generation_changes_with_state(subject):
+    generation = subject.state_generation
+    subject.anticipate_property_value("1", False)
+    assert subject.state_generation > generation
+
+    generation = subject.state_generation
+    subject._add_properties_to_pending_updates({"1": True})
+    assert subject.state_generation > generation
+
+    generation = subject.state_generation
+    assert subject.state_generation == generation
+
+
+def test_state_generation_changes_when_pending_update_expires(subject):
+    subject._pending_updates = {
+        "1": {"value": False, "updated_at": time() - 5, "sent": True}
+    }
+    generation = subject._state_generation
+    assert subject.state_generation > generation
+    assert subject._pending_updates == {}
+
+
 def test_get_key_for_value_returns_key_from_object_matching_value(subject):
     obj = {"key1": "value1", "key2": "value2"}
 
@@ -611,6 +740,67 @@ async def test_unregister_one_of_many_entities(subject, mocker):
     subject.async_stop.assert_not_called()
 
 
+@pytest.mark.asyncio
+async def test_non_persistent_dps_tracked_per_entity(subject, entity_with, mocker):
+    persistent = mocker.MagicMock(id="1", persist=True, force=False)
+    transient = mocker.MagicMock(id="2", persist=False, force=False)
+    first = entity_with([persistent, transient])
+    second = entity_with([transient])
+    subject._running = True
+    subject.register_entity(first)
+    subject.register_entity(second)
+    subject._cached_state = {"1": True, "2": 3, "updated_at": 0}
+
+    assert subject._clear_non_persistent_dps({"1": False}) == {"2"}
+    assert subject._cached_state == {"1": True, "updated_at": 0}
+
+    await subject.async_unregister_entity(first)
+    assert set(subject._non_persistent_dps) == {"2"}
+    await subject.async_unregister_entity(second)
+    assert not subject._non_persistent_dps
+
+
+@pytest.mark.asyncio
+async def test_event_dps_tracked_per_entity(subject, entity_with, mocker):
+    dp = mocker.MagicMock(id="5", persist=True, force=False, sensitive=False)
+    first = entity_with([dp])
+    first._config.entity = "event"
+    second = entity_with([dp])
+    second._config.entity = "event"
+    other = entity_with([dp])
+    other._config.entity = "sensor"
+    subject._running = True
+    for entity in (first, second, other):
+        subject.register_entity(entity)
+
+    await subject.async_unregister_entity(first)
+    assert set(subject._repeat_dps) == {"5"}
+    await subject.async_unregister_entity(second)
+    assert not subject._repeat_dps
+
+
+@pytest.mark.asyncio
+async def test_force_and_sensitive_dps_tracked_per_entity(subject, entity_with, mocker):
+    forced = mocker.MagicMock(id="10", force=True, sensitive=False)
+    secret = mocker.MagicMock(id="2", force=False, sensitive=True)
+    secret.name = "password"
+    first = entity_with([forced, secret], "first")
+    second = entity_with([forced], "second")
+    subject._running = True
+    subject.register_entity(first)
+    subject.register_entity(second)
+
+    assert subject.force_dps == [10]
+    assert set(subject.sensitive_dps) == {"2"}
+    assert subject.sensitive_attributes("first") == {"password"}
+    assert subject.sensitive_attributes("second") == set()
+
+    await subject.async_unregister_entity(first)
+    assert subject.force_dps == [10]
+    assert not subject.sensitive_dps
+    assert subject.sensitive_attributes("first") == set()
+
+
 @pytest.mark.asyncio
 async def test_unregister_last_entity(subject, mocker):
     # Set up preconditions
@@ -626,6 +816,72 @@ async def test_unregister_last_entity(subject, mocker):
     subject.async_stop.assert_called_once()
 
 
+def test_received_dps_only_affect_dependent_entities(subject, mocker):
+    first = mocker.MagicMock()
+    first._config.dependencies.return_value = {"1", "2"}
+    second = mocker.MagicMock()
+    second._config.dependencies.return_value = {"2", "3"}
+    subject._children = [first, second]
+    subject._dependents = {"1": [first], "2": [first, second], "3": [second]}
+
+    assert subject._affected_entities({"1"}) == [first]
+    assert subject._affected_entities({"3", "4"}) == [second]
+    assert subject._affected_entities({"2"}) == [first, second]
+    assert subject._affected_entities({"4"}) == []
+    assert subject._affected_entities(set(), True) == [first, second]
+
+
+@pytest.mark.asyncio
+async def test_receive_loop_skips_unchanged_dps(subject, mocker):
+    entity = mocker.MagicMock()
+    entity._config.dependencies.return_value = {"1", "2"}
+    entity._config.entity = "switch"
+    entity._config.dps.return_value = []
+    subject._children = [entity]
+    subject._dependents = {"1": [entity], "2": [entity]}
+    subject._cached_state = {"1": True, "2": 5, "updated_at": time()}
+
+    async def receive():
+        yield {"1": True, "2": 5, "full_poll": False}
+        yield {"1": True, "2": 6, "full_poll": False}
+
+    mocker.patch.object(subject, "async_receive", receive)
+    generation = subject.state_generation
+    await subject.receive_loop()
+
+    # only the second message changed anything
+    entity.schedule_update_ha_state.assert_called_once()
+    assert entity.on_receive.call_count == 2
+    assert subject.received_dps_stats == {
+        "changed": 1,
+        "unchanged": 3,
+        "unchanged_ratio": 3.0,
+    }
+    assert subject.state_generation > generation
+
+
+@pytest.mark.asyncio
+async def test_receive_loop_updates_entities_of_expired_updates(subject, mocker):
+    entity = mocker.MagicMock()
+    entity._config.entity = "switch"
+    subject._children = [entity]
+    subject._dependents = {"1": [entity]}
+    subject._cached_state = {"1": False, "updated_at": time()}
+    subject._pending_updates = {
+        "1": {"value": True, "sent": True, "updated_at": time() - 10},
+    }
+    # expired between messages, before the loop sees it
+    assert subject.get_property("1") is False
+
+    async def receive():
+        yield {"2": 5, "full_poll": False}
+
+    mocker.patch.object(subject, "async_receive", receive)
+    await subject.receive_loop()
+
+    entity.schedule_update_ha_state.assert_called_once()
+
+
 @pytest.mark.asyncio
 async def test_async_receive(subject, mock_api, mocker):
     # Set up preconditions
@@ -683,6 +939,106 @@ async def test_async_receive(subject, mock_api, mocker):
     mock_api().set_socketPersistent.assert_called_once_with(False)
 
 
+@pytest.mark.asyncio
+async def test_wait_readable_waits_for_data_in_event_loop(subject, mock_api):
+    local, remote = socket.socketpair()
+    try:
+        mock_api().parent = None
+        mock_api().received_wrong_cid_queue = []
+        mock_api().socket = local
+        assert not await subject._async_wait_readable(0.05)
+        remote.send(b"data")
+        assert await subject._async_wait_readable(1)
+    finally:
+        local.close()
+        remote.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_readable_is_interrupted_by_sending(subject, mock_api):
+    local, remote = socket.socketpair()
+    try:
+        mock_api().parent = None
+        mock_api().received_wrong_cid_queue = []
+        mock_api().socket = local
+        asyncio.get_running_loop().call_later(0.05, subject._wake_receive)
+        async with asyncio.timeout(1):
+            assert not await subject._async_wait_readable(10)
+    finally:
+        local.close()
+        remote.close()
+
+
+@pytest.mark.asyncio
+async def test_stop_ends_wait_before_closing_connection(subject, mock_api):
+    local, remote = socket.socketpair()
+    try:
+        mock_api().parent = None
+        mock_api().received_wrong_cid_queue = []
+        mock_api().socket = local
+        loop = asyncio.get_running_loop()
+        closed_while_waiting = []
+        mock_api().set_socketPersistent.side_effect = lambda persist: (
+            closed_while_waiting.append(loop.remove_reader(local.fileno()))
+        )
+        subject._refresh_task = asyncio.ensure_future(subject._async_wait_readable(10))
+        await asyncio.sleep(0)
+
+        async with asyncio.timeout(1):
+            await subject.async_stop()
+        assert closed_while_waiting == [False]
+    finally:
+        local.close()
+        remote.close()
+
+
+@pytest.mark.asyncio
+async def test_wait_readable_without_connection(subject, mock_api):
+    mock_api().parent = None
+    mock_api().received_wrong_cid_queue = []
+    mock_api().socket = None
+    assert await subject._async_wait_readable(0.05) is None
+
+
+@pytest.mark.asyncio
+async def test_offline_device_is_not_polled_continuously(subject, mock_api, mocker):
+    mock_api().parent = None
+    mock_api().received_wrong_cid_queue = []
+    mock_api().socket = None
+    mock_api().receive.return_value = {"Error": "Network Error", "Err": "901"}
+    mocker.patch.object(subject._scheduler, "is_due", return_value=False)
+    subject._running = True
+    subject._cached_state = {"1": False, "updated_at": time()}
+
+    async def consume():
+        async for _ in subject.async_receive():
+            pass
+
+    task = asyncio.ensure_future(consume())
+    await asyncio.sleep(0.5)
+    subject._running = False
+    await task
+    assert mock_api().receive.call_count < 10
+
+
+@pytest.mark.asyncio
+async def test_sub_device_without_gateway_receives_directly(subject, mock_api, mocker):
+    mock_api().parent = mocker.MagicMock()
+    mock_api().receive.return_value = {"dps": {"1": True}}
+    mocker.patch.object(subject._scheduler, "is_due", return_value=False)
+    mocker.patch.object(subject, "_async_wait_readable")
+    subject._running = True
+    subject._cached_state = {"1": False, "updated_at": time()}
+
+    loop = subject.async_receive()
+    assert await loop.__anext__() == {"1": True, "full_poll": False}
+    await loop.aclose()
+
+    # readers of the shared connection would replace each other
+    subject._async_wait_readable.assert_not_called()
+    mock_api().receive.assert_called_once()
+
+
 def test_should_poll(subject):
     subject._cached_state = {"1": "sample", "updated_at": time()}
     subject._poll_only = False
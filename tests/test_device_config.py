@@ -1,19 +1,35 @@
 """Test the config parser"""
 
+import os
+
 import pytest
 import voluptuous as vol
 from fuzzywuzzy import fuzz
 from homeassistant.components.sensor import SensorDeviceClass
 
-from custom_components.tuya_local.helpers.config import get_device_id
+from custom_components.tuya_local.helpers import device_config
+from custom_components.tuya_local.helpers.config import (
+    CATALOG_STORAGE_KEY,
+    CATALOG_STORAGE_VERSION,
+    async_load_config_catalog,
+    get_device_id,
+)
 from custom_components.tuya_local.helpers.device_config import (
+    TuyaConfigCatalog,
+    TuyaConfigSummary,
     TuyaDeviceConfig,
     TuyaDpsConfig,
     TuyaEntityConfig,
     _bytes_to_fmt,
+    _load_config,
     _typematch,
     available_configs,
+    config_catalog,
+    config_catalog_signature,
     get_config,
+    load_configs,
+    possible_matches,
+    rank_matches,
 )
 from custom_components.tuya_local.sensor import TuyaLocalSensor
 
@@ -319,6 +335,89 @@ def test_can_find_config_files():
     assert found
 
 
+def test_catalog_indexes_all_configs():
+    """Test that every config file is summarised in the catalog."""
+    catalog = config_catalog()
+    assert len(catalog) == len(list(available_configs()))
+    assert catalog.get("smartplugv1").config == "smartplugv1.yaml"
+    assert catalog.get("non_existing") is None
+
+
+def test_possible_matches_loads_matching_configs():
+    """Test that possible_matches returns full configs for catalog matches."""
+    matches = list(possible_matches({}, ["37mnhia3pojleqfh"]))
+    assert "smartplugv1" in [m.config_type for m in matches]
+    assert all(isinstance(m, TuyaDeviceConfig) for m in matches)
+
+
+def test_catalog_finds_configs_by_product_id():
+    """Test that the catalog indexes configs by their product ids."""
+    catalog = config_catalog()
+    found = catalog.for_products(["37mnhia3pojleqfh"])
+    assert [s.config_type for s in found] == ["smartplugv1"]
+    assert catalog.for_products(["unknown_product"]) == []
+    assert catalog.for_products(None) == []
+
+
+def test_product_matches_rank_above_dps_matches():
+    """Test that configs matching only by dps are offered after product matches."""
+    dps = {"1": True, "2": 0, "4": 0, "5": 0, "6": 2300}
+    ranked = rank_matches(dps, ["37mnhia3pojleqfh"])
+    assert ranked[0][0].config_type == "smartplugv1"
+    assert ranked[0][1] == 101
+    assert len(ranked) == len(list(possible_matches(dps)))
+    assert all(q <= 100 for _, q in ranked[1:])
+    top = rank_matches(dps, ["37mnhia3pojleqfh"], k=1)
+    assert [(m.config_type, q) for m, q in top] == [("smartplugv1", 101)]
+
+
+def test_catalog_candidates_agree_with_full_scan():
+    """Test that the dp index selects exactly the configs that match."""
+    catalog = config_catalog()
+    dps = {"1": True, "2": 0, "4": 0, "5": 0, "6": 2300, "7": False}
+    expected = [s.config_type for s in catalog if s.matches(dps, None)]
+    found = [s.config_type for s in catalog.candidates(dps)]
+    assert found == expected
+    assert "smartplugv1" in found
+    dps["1"] = "not a boolean"
+    assert "smartplugv1" not in [s.config_type for s in catalog.candidates(dps)]
+
+
+def test_summary_scores_dps_with_named_and_large_ids():
+    """Test that dp ids which are not small numbers are scored like others."""
+    summary = TuyaConfigSummary(
+        "test.yaml",
+        "Test",
+        [],
+        [
+            ("1", "boolean", False),
+            ("switch_led", "boolean", False),
+            ("1500", "integer", True),
+        ],
+    )
+    assert summary.match_quality({"1": True, "switch_led": False}) == 100
+    assert summary.match_quality({"1": True, "1500": 3, "switch_led": True}) == 100
+    assert summary.match_quality({"1": True, "2": 0, "switch_led": True}) == 67
+    assert summary.match_quality({"1": True}) == 0
+    assert summary.match_quality({"1": True, "switch_led": "on"}) == 0
+    assert summary.match_quality({"1": True, "1500": "x", "switch_led": True}) == 0
+
+
+def test_rank_matches_returns_best_matches_first():
+    """Test that ranked matches are ordered by quality and limited to k."""
+    dps = {"1": True, "2": 0, "4": 0, "5": 0, "6": 2300}
+    ranked = rank_matches(dps)
+    expected = sorted(
+        ((m.config_type, m.match_quality(dps)) for m in possible_matches(dps)),
+        key=lambda m: m[1],
+        reverse=True,
+    )
+    assert [(m.config_type, q) for m, q in ranked] == expected
+    top = rank_matches(dps, k=3)
+    assert [(m.config_type, q) for m, q in top] == expected[:3]
+    assert rank_matches(dps, ["37mnhia3pojleqfh"], k=1)[0][1] == 101
+
+
 def dp_match(condition, accounted, unaccounted, known, required=False):
     if isinstance(condition, str):
         known.add(condition)
@@ -509,13 +608,26 @@ def check_entity(entity, cfg, mocker):
             )
 
 
+def test_parallel_catalog_build_matches_serial_build(mocker):
+    """Test that building the catalog in processes gives the same result."""
+    configs = ["smartplugv1.yaml", "smartplugv2.yaml", "kogan_bidet.yaml"]
+    mocker.patch(
+        "custom_components.tuya_local.helpers.device_config.available_configs",
+        return_value=configs,
+    )
+    serial = TuyaConfigCatalog.build()
+    parallel = TuyaConfigCatalog.build(workers=2)
+    assert [s.as_dict() for s in parallel] == [s.as_dict() for s in serial]
+    assert [s.config for s in parallel] == configs
+
+
 def test_config_files_parse(mocker):
     """
     All configs should be parsable and meet certain criteria
     """
-    for cfg in available_configs():
+    for parsed in load_configs(available_configs(), workers=os.cpu_count()):
+        cfg = parsed.config
         entities = []
-        parsed = TuyaDeviceConfig(cfg)
         # Check for error messages or unparsed config
         if isinstance(parsed, str) or isinstance(parsed._config, str):
             pytest.fail(f"unparsable yaml in {cfg}")
@@ -617,6 +729,46 @@ def test_entity_find_unknown_dps_fails():
         break
 
 
+def test_entity_dps_are_built_once():
+    """Test that an entity's dps are reused and found by name."""
+    cfg = get_config("kogan_switch")
+    entity = next(cfg.all_entities())
+    dps = list(entity.dps())
+    assert list(entity.dps()) == dps
+    assert all(a is b for a, b in zip(entity.dps(), dps, strict=True))
+    assert entity.find_dps(dps[0].name) is dps[0]
+
+
+def test_compiled_mapping_matches_linear_scan(mocker):
+    """Test that compiled mapping lookups agree with scanning the mapping."""
+    device = mocker.MagicMock()
+    dp = TuyaDpsConfig(
+        mocker.MagicMock(),
+        {
+            "id": 1,
+            "name": "test",
+            "type": "integer",
+            "mapping": [
+                {"dps_val": 1, "value": 10},
+                {"dps_val": 2, "value": 30},
+                {"dps_val": 3, "value": 30},
+                {"dps_val": 4, "value": 50, "hidden": True},
+                {"value": 0},
+            ],
+        },
+    )
+    for value in [None, 0, 1, 2, 3, 4, 5, 10, 19, 20, 30, 40, 45, 50, 60, "10"]:
+        assert dp._find_map_for_dps(value, device) is dp._scan_map_for_dps(
+            value, device
+        )
+        assert dp._find_map_for_value(value, device) is dp._scan_map_for_value(
+            value, device
+        )
+    assert dp._forward_table
+    assert dp._find_map_for_value(20, device)["dps_val"] == 1
+    assert dp._find_map_for_value(45, device)["dps_val"] == 2
+
+
 @pytest.mark.asyncio
 async def test_dps_async_set_readonly_value_fails(mocker):
     """Test that setting a readonly dps fails."""
@@ -649,6 +801,105 @@ def test_config_returned():
     assert cfg.config == "smartplugv1.yaml"
 
 
+def test_legacy_types_are_indexed_by_the_catalog(mocker):
+    """Test that legacy config types are found without loading the yaml."""
+    config_catalog()
+    load = mocker.patch(
+        "custom_components.tuya_local.helpers.device_config._load_config",
+    )
+    assert config_catalog().for_legacy_type("kogan_switch").config_type == (
+        "smartplugv1"
+    )
+    assert config_catalog().for_legacy_type("unknown_legacy_type") is None
+    assert get_config("unknown_legacy_type") is None
+    load.assert_not_called()
+
+
+def test_config_is_shared_between_callers():
+    """Test that a config is parsed once and shared by all that use it."""
+    assert get_config("smartplugv1") is get_config("smartplugv1")
+
+
+def test_config_is_reloaded_when_file_changes(mocker):
+    """Test that the shared config is invalidated when its file changes."""
+    first = get_config("smartplugv1")
+    mock_stat = mocker.patch(
+        "custom_components.tuya_local.helpers.device_config.stat",
+    )
+    mock_stat.return_value.st_mtime_ns = 1
+    second = get_config("smartplugv1")
+    assert second is not first
+    assert get_config("smartplugv1") is second
+
+
+def test_matching_configs_load_entities_on_demand(mocker):
+    """Test that matching uses the config header, not the full yaml."""
+    config_catalog()
+    mock_stat = mocker.patch(
+        "custom_components.tuya_local.helpers.device_config.stat",
+    )
+    mock_stat.return_value.st_mtime_ns = 2
+    load = mocker.patch(
+        "custom_components.tuya_local.helpers.device_config._load_config",
+        wraps=_load_config,
+    )
+    (cfg, quality), *_ = rank_matches({"1": True}, ["37mnhia3pojleqfh"])
+    assert cfg.config_type == "smartplugv1"
+    assert quality == 101
+    assert cfg.name
+    assert cfg.product_display_entries(["37mnhia3pojleqfh"])
+    load.assert_not_called()
+    assert next(cfg.all_entities()).config_id
+    load.assert_called_once_with("smartplugv1.yaml")
+
+
+@pytest.mark.asyncio
+async def test_catalog_is_restored_from_storage(hass, hass_storage, mocker):
+    """Test that a saved catalog is used while the configs are unchanged."""
+    mocker.patch.object(device_config, "_catalog", None)
+    build = mocker.patch(
+        "custom_components.tuya_local.helpers.config.config_catalog",
+    )
+    summary = TuyaConfigSummary.from_config(
+        "smartplugv1.yaml", _load_config("smartplugv1.yaml")
+    )
+    hass_storage[CATALOG_STORAGE_KEY] = {
+        "version": CATALOG_STORAGE_VERSION,
+        "key": CATALOG_STORAGE_KEY,
+        "data": {
+            "signature": config_catalog_signature(),
+            "configs": [summary.as_dict()],
+        },
+    }
+    await async_load_config_catalog(hass)
+    build.assert_not_called()
+    assert [s.config_type for s in config_catalog()] == ["smartplugv1"]
+
+
+@pytest.mark.asyncio
+async def test_catalog_is_rebuilt_when_configs_change(hass, hass_storage, mocker):
+    """Test that a stale saved catalog is rebuilt and saved again."""
+    mocker.patch.object(device_config, "_catalog", None)
+    summary = TuyaConfigSummary.from_config(
+        "smartplugv1.yaml", _load_config("smartplugv1.yaml")
+    )
+    build = mocker.patch(
+        "custom_components.tuya_local.helpers.config.config_catalog",
+        return_value=TuyaConfigCatalog([summary]),
+    )
+    hass_storage[CATALOG_STORAGE_KEY] = {
+        "version": CATALOG_STORAGE_VERSION,
+        "key": CATALOG_STORAGE_KEY,
+        "data": {"signature": "stale", "configs": []},
+    }
+    await async_load_config_catalog(hass)
+    build.assert_called_once()
+    await hass.async_block_till_done()
+    saved = hass_storage[CATALOG_STORAGE_KEY]["data"]
+    assert saved["signature"] == config_catalog_signature()
+    assert saved["configs"] == [summary.as_dict()]
+
+
 def test_float_matches_ints():
     """Test that the _typematch function matches int values to float dps"""
     assert _typematch(float, 1)
@@ -675,6 +926,29 @@ def test_deprecation(mocker):
     )
 
 
+def test_dp_static_attributes_are_read_once(mocker):
+    """Test that the static attributes of a dp are taken from its config."""
+    mock_config = {
+        "id": 2,
+        "name": "test",
+        "type": "integer",
+        "mask": "00FF",
+        "persist": False,
+        "range": {"min": 0, "max": 100},
+    }
+    cfg = TuyaDpsConfig(mocker.MagicMock(), mock_config)
+    mock_config["name"] = "changed"
+    assert cfg.id == "2"
+    assert cfg.name == "test"
+    assert cfg.type is int
+    assert cfg.rawtype == "integer"
+    assert cfg.mask == 0xFF
+    assert cfg.endianness == "big"
+    assert not cfg.persist
+    assert not cfg.force
+    assert not cfg.readonly
+
+
 def test_format_with_none_defined(mocker):
     """Test that format returns None when there is none configured."""
     mock_entity = mocker.MagicMock()
@@ -683,6 +957,27 @@ def test_format_with_none_defined(mocker):
     assert cfg.format is None
 
 
+def test_format_is_compiled_once(mocker):
+    """Test that a packed format is compiled once into a struct."""
+    mock_entity = mocker.MagicMock()
+    mock_config = {
+        "id": "1",
+        "name": "test",
+        "type": "hex",
+        "format": [
+            {"name": "h", "bytes": 2, "range": {"min": 0, "max": 360}},
+            {"name": "s", "bytes": 2, "range": {"min": 0, "max": 1000}},
+            {"name": "v", "bytes": 2, "range": {"min": -10, "max": 1000}},
+        ],
+    }
+    cfg = TuyaDpsConfig(mock_entity, mock_config)
+    fmt = cfg.format
+    assert fmt["format"] == ">HHh"
+    assert fmt["names"] == ["h", "s", "v"]
+    assert fmt["struct"].unpack(bytes.fromhex("00b403e8fff6")) == (180, 1000, -10)
+    assert cfg.format is fmt
+
+
 def test_decoding_base64(mocker):
     """Test that decoded_value works with base64 encoding."""
     mock_entity = mocker.MagicMock()
@@ -984,3 +1279,45 @@ def test_writing_target_range(mocker):
     mock_device = mocker.MagicMock()
     cfg = TuyaDpsConfig(mock_entity, mock_config)
     assert cfg.get_values_to_set(mock_device, 100) == {"1": 16}
+
+
+def test_decoded_value_is_reused_within_a_state_generation(mocker):
+    """Test that a dp is decoded once per device state generation."""
+    mock_config = {
+        "id": 1,
+        "name": "test",
+        "type": "integer",
+        "range": {"min": 0, "max": 16},
+        "mapping": [{"target_range": {"min": 0, "max": 100}}],
+    }
+    mock_device = mocker.MagicMock()
+    mock_device.state_generation = 1
+    mock_device.get_property.return_value = 8
+    cfg = TuyaDpsConfig(mocker.MagicMock(), mock_config)
+    assert cfg.get_value(mock_device) == 50
+    calls = mock_device.get_property.call_count
+    assert cfg.get_value(mock_device) == 50
+    assert mock_device.get_property.call_count == calls
+
+    mock_device.get_property.return_value = 4
+    assert cfg.get_value(mock_device) == 50
+    mock_device.state_generation = 2
+    assert cfg.get_value(mock_device) == 25
+
+
+def test_entity_dependencies_are_its_dps(mocker):
+    """Test that an entity depends on the dps of all its attributes."""
+    mock_config = {
+        "entity": "switch",
+        "dps": [
+            {
+                "id": 1,
+                "name": "switch",
+                "type": "boolean",
+                "mapping": [{"dps_val": False, "available": "allowed"}],
+            },
+            {"id": 2, "name": "allowed", "type": "boolean"},
+        ],
+    }
+    cfg = TuyaEntityConfig(mocker.MagicMock(), mock_config)
+    assert cfg.dependencies() == {"1", "2"}
@@ -12,11 +12,14 @@ from custom_components.tuya_local.const import (
     CONF_LOCAL_KEY,
     CONF_PROTOCOL_VERSION,
     CONF_TYPE,
+    DATA_IO_POOL,
     DOMAIN,
 )
+from custom_components.tuya_local.device import TuyaLocalDevice
 from custom_components.tuya_local.diagnostics import (
     async_get_config_entry_diagnostics,
     async_get_device_diagnostics,
+    redact_entity,
 )
 from custom_components.tuya_local.helpers.device_config import TuyaEntityConfig
 
@@ -35,6 +38,7 @@ async def test_config_entry_diagnostics(hass):
     m_device = Mock()
     m_device._api_protocol_version_index = 0
     m_device._children = []
+    m_device.sensitive_dps = set()
     m_device._cached_state = {"1": "Test"}
     m_device._pending_updates = {}
     hass.data[DOMAIN] = {"test_device": {"device": m_device}}
@@ -56,16 +60,20 @@ async def test_device_diagnostics(hass):
     m_device = Mock()
     m_device._api_protocol_version_index = 0
     m_device._children = []
+    m_device.sensitive_dps = set()
     m_device._cached_state = {"1": "Test"}
     m_device._pending_updates = {}
     hass.data[DOMAIN] = {"test_device": {"device": m_device}}
     diag = await async_get_device_diagnostics(hass, entry, m_device)
 
     assert diag
+    # reporting on the pool does not start it
+    assert "io_pool" not in diag
+    assert DATA_IO_POOL not in hass.data[DOMAIN]
 
 
 @pytest.mark.asyncio
-async def test_diagnostic_redaction(hass):
+async def test_diagnostic_redaction(hass, mocker):
     entry = MockConfigEntry(
         domain=DOMAIN,
         data={
@@ -76,7 +84,11 @@ async def test_diagnostic_redaction(hass):
             CONF_TYPE: "",
         },
     )
-    m_device = Mock()
+    mocker.patch("tinytuya.Device")
+    hass.data[DOMAIN] = {}
+    device = TuyaLocalDevice(
+        "Test", "test_device", "some.ip", "some_key", "auto", None, hass
+    )
     m_entity = Mock()
     config = TuyaEntityConfig(
         Mock(),
@@ -98,13 +110,18 @@ async def test_diagnostic_redaction(hass):
         },
     )
     m_entity._config = config
-    m_device._api_protocol_version_index = 0
-    m_device._children = [m_entity]
-    m_device._cached_state = {"1": "Test", "2": "secret"}
-    m_device._pending_updates = {}
-    hass.data[DOMAIN] = {"test_device": {"device": m_device}}
-    diag = await async_get_device_diagnostics(hass, entry, m_device)
+    device._running = True
+    device.register_entity(m_entity)
+    device._api_protocol_version_index = 0
+    device._cached_state = {"1": "Test", "2": "secret"}
+    hass.data[DOMAIN] = {"test_device": {"device": device}}
+    diag = await async_get_device_diagnostics(hass, entry, device)
 
     assert diag["device_id"] is REDACTED
     assert diag["local_key"] is REDACTED
+    assert diag["cached_state"]["1"] == "Test"
     assert diag["cached_state"]["2"] is REDACTED
+    assert redact_entity(
+        device, config.config_id, {"sensor": "Test", "secrets": "secret"}
+    ) == {"sensor": "Test", "secrets": REDACTED}
+    assert redact_entity(device, "other", {"secrets": "x"}) == {"secrets": "x"}
@@ -0,0 +1,131 @@
+"""Tests for the shared reader of gateway connections."""
+
+import asyncio
+import socket
+from unittest.mock import MagicMock
+
+import pytest
+
+from custom_components.tuya_local.helpers.gateway import GatewayReader
+
+
+@pytest.fixture
+def api():
+    api = MagicMock()
+    api.id = "gateway"
+    api.socket = None
+    api.received_wrong_cid_queue = []
+    return api
+
+
+@pytest.fixture
+def gateway(hass, api):
+    gateway = GatewayReader(hass, api, asyncio.Lock())
+    yield gateway
+    for cid in list(gateway._queues):
+        gateway.unsubscribe(cid)
+
+
+@pytest.mark.asyncio
+async def test_messages_are_routed_by_cid(gateway):
+    first = MagicMock(cid="first")
+    gateway.subscribe("first")
+    gateway.subscribe("second")
+
+    gateway._dispatch({"dps": {"1": True}, "device": first})
+    gateway._dispatch({"data": {"cid": "second", "dps": {"2": 5}}})
+    gateway._dispatch({"cid": "unknown", "dps": {"3": 1}})
+
+    assert await gateway.async_receive("first", 0.1) == {"dps": {"1": True}}
+    assert await gateway.async_receive("second", 0.1) == {
+        "data": {"cid": "second", "dps": {"2": 5}}
+    }
+    assert await gateway.async_receive("first", 0.01) is None
+    assert await gateway.async_receive("second", 0.01) is None
+
+
+@pytest.mark.asyncio
+async def test_receive_is_interrupted_by_wake(gateway):
+    gateway.subscribe("child")
+    wake = asyncio.get_running_loop().create_future()
+    asyncio.get_running_loop().call_later(0.05, wake.set_result, False)
+    async with asyncio.timeout(1):
+        assert await gateway.async_receive("child", 10, wake) is None
+    gateway._dispatch({"cid": "child", "dps": {"1": True}})
+    assert await gateway.async_receive("child", 0.1, wake) == {
+        "cid": "child",
+        "dps": {"1": True},
+    }
+
+
+@pytest.mark.asyncio
+async def test_messages_without_cid_go_to_the_gateway(gateway):
+    gateway.subscribe(None)
+    gateway.subscribe("child")
+    gateway._dispatch({"dps": {"1": True}})
+    assert await gateway.async_receive(None, 0.1) == {"dps": {"1": True}}
+    assert await gateway.async_receive("child", 0.01) is None
+
+
+@pytest.mark.asyncio
+async def test_errors_go_to_all_subscribers(gateway):
+    gateway.subscribe("first")
+    gateway.subscribe("second")
+    gateway._dispatch({"Err": "904", "Error": "Unexpected Payload"})
+    gateway._dispatch({"Err": "905", "Error": "Network Error"})
+    for cid in ("first", "second"):
+        assert (await gateway.async_receive(cid, 0.1))["Err"] == "905"
+        assert await gateway.async_receive(cid, 0.01) is None
+
+
+@pytest.mark.asyncio
+async def test_queued_messages_are_unwrapped(gateway):
+    gateway.subscribe("child")
+    gateway._dispatch((MagicMock(cid="child"), {"dps": {"1": False}}))
+    assert await gateway.async_receive("child", 0.1) == {"dps": {"1": False}}
+
+
+@pytest.mark.asyncio
+async def test_reader_delivers_received_messages(gateway, api):
+    local, remote = socket.socketpair()
+    try:
+        api.socket = local
+
+        def receive():
+            local.recv(16)
+            return {"dps": {"1": True}, "device": MagicMock(cid="child")}
+
+        api.receive.side_effect = receive
+        gateway.subscribe("child")
+        remote.send(b"x")
+        assert await gateway.async_receive("child", 2) == {"dps": {"1": True}}
+
+        assert gateway.subscribed("child")
+        gateway.unsubscribe("child")
+        assert not gateway.subscribed("child")
+        assert gateway._task is None
+    finally:
+        local.close()
+        remote.close()
+
+
+@pytest.mark.asyncio
+async def test_reader_skips_data_read_while_waiting_for_lock(hass, api):
+    lock = asyncio.Lock()
+    gateway = GatewayReader(hass, api, lock)
+    local, remote = socket.socketpair()
+    try:
+        api.socket = local
+        await lock.acquire()
+        gateway.subscribe("child")
+        remote.send(b"x")
+        await asyncio.sleep(0.05)
+        # a sub-device polling under the lock consumes the data
+        local.recv(16)
+        lock.release()
+        await asyncio.sleep(0.05)
+        api.receive.assert_not_called()
+    finally:
+        gateway.unsubscribe("child")
+        local.close()
+        remote.close()
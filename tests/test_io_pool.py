@@ -0,0 +1,61 @@
+"""Tests for the device I/O thread pool."""
+
+import asyncio
+from threading import Event
+
+import pytest
+
+from custom_components.tuya_local.const import DATA_IO_POOL, DOMAIN
+from custom_components.tuya_local.helpers.io_pool import DeviceIoPool, device_io_pool
+
+
+@pytest.mark.asyncio
+async def test_pool_runs_calls_and_reports_waits():
+    pool = DeviceIoPool(1)
+    try:
+        release = Event()
+        blocked = asyncio.ensure_future(pool.async_run(release.wait, 5))
+        queued = asyncio.ensure_future(pool.async_run(sum, [1, 2]))
+        await asyncio.sleep(0.05)
+        stats = pool.stats()
+        assert stats["workers"] == 1
+        assert stats["running"] == 1
+        assert stats["queue_depth"] == 1
+
+        release.set()
+        assert await blocked is True
+        assert await queued == 3
+        stats = pool.stats()
+        assert stats["running"] == 0
+        assert stats["queue_depth"] == 0
+        assert stats["max_wait"] >= 0.05
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_call_leaves_the_queue():
+    pool = DeviceIoPool(1)
+    try:
+        release = Event()
+        blocked = asyncio.ensure_future(pool.async_run(release.wait, 5))
+        queued = asyncio.ensure_future(pool.async_run(sum, [1, 2]))
+        await asyncio.sleep(0.05)
+        queued.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await queued
+        assert pool.stats()["queue_depth"] == 0
+        release.set()
+        await blocked
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_pool_is_shared_and_stopped_with_home_assistant(hass):
+    pool = device_io_pool(hass)
+    assert device_io_pool(hass) is pool
+    assert hass.data[DOMAIN][DATA_IO_POOL] is pool
+
+    await hass.async_stop(force=True)
+    assert DATA_IO_POOL not in hass.data[DOMAIN]
@@ -11,6 +11,8 @@ from custom_components.tuya_local.const import (
     CONF_TYPE,
     DOMAIN,
 )
+from custom_components.tuya_local.device import TuyaLocalDevice
+from custom_components.tuya_local.helpers.device_config import get_config
 from custom_components.tuya_local.lock import TuyaLocalLock, async_setup_entry
 
 
@@ -94,3 +96,21 @@ async def test_init_entry_fails_if_config_is_missing(hass):
     except ValueError:
         pass
     m_add_entities.assert_not_called()
+
+
+@pytest.mark.asyncio
+async def test_changed_by_clears_non_persistent_unlock_dp(hass, mocker):
+    """Test that the unlocker is only reported once, with a real device."""
+    mocker.patch("tinytuya.Device")
+    hass.data[DOMAIN] = {}
+    device = TuyaLocalDevice("Test", "dummy", "some.ip", "some_key", "auto", None, hass)
+    config = get_config("ailrinni_fingerprint_lock")
+    lock = TuyaLocalLock(
+        device, next(e for e in config.all_entities() if e.entity == "lock")
+    )
+    device._cached_state = {"12": 5, "47": True, "updated_at": 0}
+    device._state_changed()
+
+    assert lock.changed_by == "Finger #5"
+    assert device.get_property("12") is None
+    assert lock.changed_by is None
@@ -0,0 +1,60 @@
+"""Tests for the scheduling of device heartbeats and polls."""
+
+from custom_components.tuya_local.helpers.scheduler import (
+    FULL_POLL,
+    HEARTBEAT,
+    PollScheduler,
+)
+
+
+def test_new_device_needs_full_poll():
+    scheduler = PollScheduler()
+    scheduler.add("dev", now=100)
+    assert scheduler.is_due("dev", FULL_POLL, 100)
+    assert not scheduler.is_due("dev", HEARTBEAT, 100)
+
+
+def test_heartbeats_are_spread_over_the_interval():
+    scheduler = PollScheduler(heartbeat_interval=5)
+    for i in range(20):
+        scheduler.add(i, now=0)
+        scheduler.done(i, FULL_POLL, 0)
+    slots = sorted(scheduler._deadlines[i][HEARTBEAT] % 5 for i in range(20))
+    # no two devices closer than a fifth of their even share of the interval
+    assert min(b - a for a, b in zip(slots, slots[1:], strict=False)) > 5 / 20 / 5
+
+
+def test_next_deadline_keeps_phase_and_interval():
+    scheduler = PollScheduler(heartbeat_interval=5, full_poll_interval=30)
+    scheduler.add("dev", now=0)
+    scheduler.done("dev", FULL_POLL, 0)
+    first = scheduler._deadlines["dev"][HEARTBEAT]
+    scheduler.done("dev", HEARTBEAT, first)
+    assert scheduler._deadlines["dev"][HEARTBEAT] == first + 5
+    assert scheduler.next_deadline("dev") == first + 5
+    assert scheduler.interval(HEARTBEAT) == 5
+    assert scheduler.interval(FULL_POLL) == 30
+
+
+def test_expedite_and_remove():
+    scheduler = PollScheduler()
+    scheduler.add("dev", now=0)
+    scheduler.done("dev", FULL_POLL, 0)
+    assert not scheduler.is_due("dev", FULL_POLL, 1)
+    scheduler.expedite("dev", FULL_POLL, 1)
+    assert scheduler.is_due("dev", FULL_POLL, 1)
+    scheduler.remove("dev")
+    assert len(scheduler) == 0
+
+
+def test_stats_report_queue_depth_and_lag():
+    scheduler = PollScheduler(heartbeat_interval=5, full_poll_interval=30)
+    scheduler.add("a", now=0)
+    scheduler.add("b", now=0)
+    assert scheduler.stats(0)["queue_depth"] == 2
+    scheduler.done("a", FULL_POLL, 2)
+    stats = scheduler.stats(2)
+    assert stats["devices"] == 2
+    assert stats["queue_depth"] == 1
+    assert stats["max_lag"] == 2
+    assert stats["average_lag"] == 2
@@ -1,9 +1,13 @@
 """Find matching devices for the supplied dp list"""
 
 import json
+import os
 import sys
 
-from custom_components.tuya_local.helpers.device_config import possible_matches
+from custom_components.tuya_local.helpers.device_config import (
+    config_catalog,
+    rank_matches,
+)
 
 from .common_funcs import FakeDevice
 
@@ -11,20 +15,15 @@ from .common_funcs import FakeDevice
 def main() -> int:
     dps = json.loads(" ".join(sys.argv[1:]))
     device = FakeDevice(dps)
-    best = 0
-    best_matches = set()
+    config_catalog(workers=os.cpu_count())
+    ranked = rank_matches(dps)
+    best = ranked[0][1] if ranked else 0
 
-    for m in possible_matches(dps):
-        if m.match_quality(dps) > best:
-            best_matches.clear()
-            best = m.match_quality(dps)
-
-        if m.match_quality(dps) == best:
-            best_matches.add(m)
-
-    for m in best_matches:
+    for m, quality in ranked:
+        if quality < best:
+            break
         dps_seen = set(dps.keys())
-        print(f"{m.config_type} matched {m.match_quality(dps)}%")
+        print(f"{m.config_type} matched {quality}%")
         for entity in m.all_entities():
             print(f"  {entity.config_id}:")
             for dp in entity.dps():
@@ -1,9 +1,13 @@
 """Find matching devices for the supplied dp list"""
 
 import json
+import os
 import sys
 
-from custom_components.tuya_local.helpers.device_config import possible_matches
+from custom_components.tuya_local.helpers.device_config import (
+    config_catalog,
+    rank_matches,
+)
 
 from .common_funcs import FakeDevice
 
@@ -12,9 +16,10 @@ def main() -> int:
     dps = json.loads(" ".join(sys.argv[1:]))
     device = FakeDevice(dps)
 
-    for match in possible_matches(dps):
+    config_catalog(workers=os.cpu_count())
+    for match, quality in rank_matches(dps):
         dps_seen = set(dps.keys())
-        print(f"{match.config_type} matched {match.match_quality(dps)}%")
+        print(f"{match.config_type} matched {quality}%")
         for entity in match.all_entities():
             print(f"  {entity.config_id}:")
             for dp in entity.dps():
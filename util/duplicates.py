@@ -1,13 +1,18 @@
 """Check for duplicates of the supplied file."""
 
+import os
 import sys
 
-from custom_components.tuya_local.helpers.device_config import possible_matches
+from custom_components.tuya_local.helpers.device_config import (
+    config_catalog,
+    rank_matches,
+)
 
 from .common_funcs import load_config, make_sample_dps
 
 
 def main():
+    config_catalog(workers=os.cpu_count())
     for filename in sys.argv[1:]:
         config = load_config(filename)
         if config is None:
@@ -16,13 +21,12 @@ def main():
         sample_dps = make_sample_dps(config)
 
         # device = FakeDevice(sample_dps)
-        for m in possible_matches(sample_dps):
+        for m, quality in rank_matches(sample_dps):
+            if quality <= 50:
+                break
             if m.config_type == config.config_type:
                 continue
-            if m.match_quality(sample_dps) > 50:
-                print(
-                    f"{m.config_type} matched {filename} {m.match_quality(sample_dps)}%"
-                )
+            print(f"{m.config_type} matched {filename} {quality}%")
 
 
 if __name__ == "__main__":